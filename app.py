@@ -1,8 +1,126 @@
 import streamlit as st
-import sys
 import os
+import sys
 import time
-from main import MultiAgentCodingSystem, Colors
+import uuid
+from main import PROFILE, MultiAgentCodingSystem
+from profiling import format_report
+from run_manager import RunManager
+from scheduler import PRIORITIES
+from tracing import TRACE_DIR, activate, span
+
+# Seconds between refreshes of an in-progress run
+POLL_SECONDS = 1.0
+
+def render_results(results, output_tabs):
+    """Render pipeline results into the output tabs."""
+    # Structured Requirements tab
+    with output_tabs[0]:
+        st.markdown("### Structured Requirements")
+        st.code(results["structured_requirement"], language="json")
+        
+        # Download button
+        st.download_button(
+            label="Download Structured Requirements",
+            data=results["structured_requirement"],
+            file_name="structured_requirements.json",
+            mime="application/json"
+        )
+    
+    # Code tab
+    with output_tabs[1]:
+        st.markdown("### Generated Code")
+        if results["review_passed"]:
+            st.success("✓ Code passed review")
+        else:
+            st.warning("⚠ Code did not pass all reviews")
+        st.code(results["code"], language="python")
+        
+        # Download button
+        st.download_button(
+            label="Download Code",
+            data=results["code"],
+            file_name="main.py",
+            mime="text/plain"
+        )
+    
+    # Documentation tab
+    with output_tabs[2]:
+        st.markdown("### Documentation")
+        st.markdown(results["documentation"])
+        
+        # Download button
+        st.download_button(
+            label="Download Documentation",
+            data=results["documentation"],
+            file_name="documentation.md",
+            mime="text/plain"
+        )
+    
+    # Tests tab
+    with output_tabs[3]:
+        st.markdown("### Test Cases")
+        st.code(results["tests"], language="python")
+        
+        # Download button
+        st.download_button(
+            label="Download Tests",
+            data=results["tests"],
+            file_name="test_main.py",
+            mime="text/plain"
+        )
+    
+    # UI Code tab
+    with output_tabs[4]:
+        st.markdown("### Streamlit UI Code")
+        lint = results.get("ui_lint")
+        if lint and lint["issues"]:
+            st.warning(f"⚠ {len(lint['issues'])} rerun performance finding(s) left")
+            st.markdown("\n".join(f"- **{issue['severity']}** {issue['location']}: {issue['description']}"
+                                   for issue in lint["issues"]))
+        elif lint:
+            st.success("✓ No rerun performance findings")
+        st.code(results["ui_code"], language="python")
+        
+        # Download button
+        st.download_button(
+            label="Download UI Code",
+            data=results["ui_code"],
+            file_name="app.py",
+            mime="text/plain"
+        )
+
+@st.cache_resource
+def get_run_manager() -> RunManager:
+    """The worker pool shared by every session of this server."""
+    return RunManager(MultiAgentCodingSystem)
+
+def render_scheduler(scheduler):
+    """Queue depth and wait times of agent calls, per priority class."""
+    metrics = scheduler.metrics()
+    with st.sidebar.expander("LLM scheduler"):
+        st.metric("Slots in use", f"{metrics['in_use']}/{metrics['slots']}")
+        for priority in PRIORITIES:
+            entry = metrics["classes"][priority]
+            wait = f"{entry['wait_p95']:.1f}s" if entry["wait_p95"] is not None else "-"
+            st.text(f"{priority}: {entry['queued']} queued, {entry['running']} running, p95 wait {wait}")
+        if metrics["preemptions"]:
+            st.caption(f"Batch runs paused {metrics['preemptions']} time(s) for "
+                       f"{metrics['preempted_seconds']:.0f}s in the last {metrics['window_seconds']:.0f}s")
+
+def render_progress(handle):
+    """Render the state and per-stage progress events of a run."""
+    st.progress(handle.progress)
+    if handle.status == "completed":
+        st.success(f"Solution generated in {handle.finished_at - handle.started_at:.2f} seconds! (run {handle.results['run_id']})")
+    elif handle.status == "failed":
+        st.error("The pipeline failed.")
+        st.code(handle.error)
+    else:
+        st.text(handle.current)
+    with st.expander("Progress", expanded=not handle.done):
+        for event in handle.events:
+            st.text(f"{time.strftime('%H:%M:%S', time.localtime(event['time']))}  {event['text']}")
 
 def create_streamlit_app():
     """Create a Streamlit application for the multi-agent system."""
@@ -43,153 +161,76 @@ def create_streamlit_app():
         "System Log"
     ])
     
-    # Initialize session state
-    if 'pipeline_results' not in st.session_state:
-        st.session_state.pipeline_results = None
-    if 'log_output' not in st.session_state:
-        st.session_state.log_output = []
-    
-    # Custom stdout to capture print statements
-    class StreamlitCapture:
-        def __init__(self):
-            self.content = []
-            
-        def write(self, content):
-            self.content.append(content)
-            content_str = ''.join(self.content)
-            with output_tabs[5]:
-                st.session_state.log_output.append(content)
-                st.code(''.join(st.session_state.log_output), language=None)
-                
-        def flush(self):
-            pass
+    # Runs execute in a worker pool shared by all sessions; a session only holds the run id,
+    # mirrored into the URL so a refresh reattaches to the run
+    manager = get_run_manager()
+    if "run_id" not in st.session_state:
+        st.session_state.run_id = st.query_params.get("run")
+    if "rendered_trace" not in st.session_state:
+        st.session_state.rendered_trace = None
+    # Each browser session is a tenant, so sessions get fair shares of the LLM slots
+    if "tenant" not in st.session_state:
+        st.session_state.tenant = f"session-{uuid.uuid4().hex[:8]}"
     
-    # Run the pipeline when a button is clicked
+    # Submit the pipeline when the button is clicked
     col1, col2 = st.columns([1, 5])
     with col1:
         run_button = st.button("Generate Solution", type="primary", use_container_width=True)
+    # Profiling is on by default with PROFILE=1 or `streamlit run app.py -- --profile`
+    profile = st.sidebar.checkbox("Profile runs", value=PROFILE or "--profile" in sys.argv[1:],
+                                  help="Split LLM wait from local CPU per stage and report hot spots")
+    # After a completed run, an edited requirement can regenerate only what it changes
+    previous = manager.get(st.session_state.run_id) if st.session_state.run_id else None
+    incremental = previous is not None and previous.status == "completed" and st.sidebar.checkbox(
+        "Only regenerate what changed", value=True,
+        help="Patch the last run's outputs for the edited requirement instead of starting over")
+    if run_button and requirement:
+        handle = manager.submit(requirement, profile=profile, previous=previous.results if incremental else None,
+                                tenant=st.session_state.tenant)
+        st.session_state.run_id = handle.id
+        st.query_params["run"] = handle.id
+    
+    scheduler = manager.scheduler
+    if scheduler is not None:
+        render_scheduler(scheduler)
     
+    handle = manager.get(st.session_state.run_id) if st.session_state.run_id else None
     with col2:
-        if run_button and requirement:
-            # Set up a progress bar
-            progress_bar = st.progress(0)
-            progress_text = st.empty()
-            progress_text.text("Initializing agents...")
-            
-            # Capture stdout
-            original_stdout = sys.stdout
-            capture = StreamlitCapture()
-            sys.stdout = capture
-            
-            try:
-                # Reset log output
-                st.session_state.log_output = []
-                
-                # Initialize the multi-agent system
-                system = MultiAgentCodingSystem()
-                
-                progress_bar.progress(10)
-                progress_text.text("Running requirement analysis...")
-                
-                # Record the start time
-                start_time = time.time()
-                
-                # Run the pipeline
-                results = system.run_full_pipeline(requirement)
-                st.session_state.pipeline_results = results
-                
-                # Calculate elapsed time
-                elapsed_time = time.time() - start_time
-                
-                progress_bar.progress(100)
-                progress_text.text(f"Solution generated in {elapsed_time:.2f} seconds!")
-                
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
-                import traceback
-                st.code(traceback.format_exc())
-            finally:
-                # Restore stdout
-                sys.stdout = original_stdout
+        if st.session_state.run_id and handle is None:
+            st.warning("That run is no longer available (the server restarted or it expired).")
+        elif handle is not None:
+            render_progress(handle)
     
     # Display results in tabs
-    if st.session_state.pipeline_results:
-        # Structured Requirements tab
-        with output_tabs[0]:
-            st.markdown("### Structured Requirements")
-            st.code(st.session_state.pipeline_results["structured_requirement"], language="json")
-            
-            # Download button
-            st.download_button(
-                label="Download Structured Requirements",
-                data=st.session_state.pipeline_results["structured_requirement"],
-                file_name="structured_requirements.json",
-                mime="application/json"
-            )
-        
-        # Code tab
-        with output_tabs[1]:
-            st.markdown("### Generated Code")
-            if st.session_state.pipeline_results["review_passed"]:
-                st.success("✓ Code passed review")
-            else:
-                st.warning("⚠ Code did not pass all reviews")
-            st.code(st.session_state.pipeline_results["code"], language="python")
-            
-            # Download button
-            st.download_button(
-                label="Download Code",
-                data=st.session_state.pipeline_results["code"],
-                file_name="main.py",
-                mime="text/plain"
-            )
-        
-        # Documentation tab
-        with output_tabs[2]:
-            st.markdown("### Documentation")
-            st.markdown(st.session_state.pipeline_results["documentation"])
-            
-            # Download button
-            st.download_button(
-                label="Download Documentation",
-                data=st.session_state.pipeline_results["documentation"],
-                file_name="documentation.md",
-                mime="text/plain"
-            )
-        
-        # Tests tab
-        with output_tabs[3]:
-            st.markdown("### Test Cases")
-            st.code(st.session_state.pipeline_results["tests"], language="python")
-            
-            # Download button
-            st.download_button(
-                label="Download Tests",
-                data=st.session_state.pipeline_results["tests"],
-                file_name="test_main.py",
-                mime="text/plain"
-            )
-        
-        # UI Code tab
-        with output_tabs[4]:
-            st.markdown("### Streamlit UI Code")
-            st.code(st.session_state.pipeline_results["ui_code"], language="python")
-            
-            # Download button
-            st.download_button(
-                label="Download UI Code",
-                data=st.session_state.pipeline_results["ui_code"],
-                file_name="app.py",
-                mime="text/plain"
-            )
+    if handle is not None and handle.status == "completed":
+        if st.session_state.rendered_trace != handle.id:
+            # Include the first rendering in the run's trace, then write it out again
+            with activate(handle.tracer), span("render results", cat="ui"):
+                render_results(handle.results, output_tabs)
+            st.session_state.rendered_trace = handle.id
+            if TRACE_DIR:
+                handle.tracer.export()
+        else:
+            render_results(handle.results, output_tabs)
+        if TRACE_DIR:
+            st.caption(f"Trace: {os.path.join(TRACE_DIR, f'run_{handle.id}.json')}")
+        if handle.results.get("profile"):
+            with st.expander("Profile"):
+                st.code(format_report(handle.results["profile"]), language=None)
+                if handle.results.get("profile_path"):
+                    st.caption(f"Profile: {handle.results['profile_path']}")
     
-    # Log tab (already handled by the StreamlitCapture class)
+    # Log tab
     with output_tabs[5]:
-        if not st.session_state.log_output:
+        if handle is None or not handle.log:
             st.info("Run the system to see logs")
         else:
-            # Already populated by the capture system
-            pass
+            st.code("".join(handle.log), language=None)
+    
+    # Poll until the run finishes
+    if handle is not None and not handle.done:
+        time.sleep(POLL_SECONDS)
+        st.rerun()
 
 if __name__ == "__main__":
     create_streamlit_app()
\ No newline at end of file
@@ -0,0 +1,188 @@
+import difflib
+import hashlib
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from tracing import span
+
+# Root of the per-run artifact store
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "output/artifacts")
+
+
+def atomic_write(path: str, content: str):
+    """Write a file atomically: temp file in the same directory, fsync, then rename."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def line_delta(old: str, new: str) -> List:
+    """Compact line-based delta turning old into new."""
+    old_lines, new_lines = old.splitlines(keepends=True), new.splitlines(keepends=True)
+    delta = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif new_lines[j1:j2]:
+            delta.append("".join(new_lines[j1:j2]))
+    return delta
+
+
+def apply_delta(old: str, delta: List) -> str:
+    """Rebuild the new text from the old text and a line_delta."""
+    old_lines = old.splitlines(keepends=True)
+    return "".join("".join(old_lines[op[0]:op[1]]) if isinstance(op, list) else op for op in delta)
+
+
+class ArtifactStore:
+    """Per-run, content-addressed artifact store.
+
+    Blobs live once under objects/<hash>, however many runs or files share
+    them. Each run has a manifest mapping its logical file names to blobs and
+    a version history (first version in full, later ones as line deltas).
+    Writes happen on a background thread; call flush() to wait for them.
+    Run files are hard links to their blobs, so treat them as read-only.
+    """
+
+    def __init__(self, root: str = ARTIFACT_DIR):
+        self.root = root
+        self._manifests: Dict[str, Dict] = {}
+        # Latest text of each versioned file, to diff the next version against
+        self._latest: Dict = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Callable]" = queue.Queue()
+        self._errors: List[BaseException] = []
+        self._writer = threading.Thread(target=self._drain, name="artifact-writer", daemon=True)
+        self._writer.start()
+
+    # Background writer
+
+    def _drain(self):
+        while True:
+            task = self._queue.get()
+            try:
+                task()
+            except BaseException as e:  # reported by flush()
+                self._errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, task: Callable):
+        """Run a write on the background writer thread."""
+        self._queue.put(task)
+
+    def flush(self, release: Optional[str] = None):
+        """Wait for pending writes and persist manifests; re-raise the first write error.
+
+        ``release`` names a finished run whose manifest and version texts are
+        dropped from memory once persisted, so a long-lived process does not
+        keep (and rewrite) every run it has served.
+        """
+        with self._lock:
+            manifests = {run_id: json.dumps(manifest, indent=2) for run_id, manifest in self._manifests.items()}
+            if release is not None:
+                self._manifests.pop(release, None)
+                for key in [key for key in self._latest if key[0] == release]:
+                    del self._latest[key]
+        for run_id, manifest in manifests.items():
+            self.submit(lambda run_id=run_id, manifest=manifest:
+                        atomic_write(os.path.join(self.run_dir(run_id), "manifest.json"), manifest))
+        with span("artifact flush", cat="io"):
+            self._queue.join()
+        if self._errors:
+            error, self._errors = self._errors[0], []
+            raise error
+
+    # Layout
+
+    def run_dir(self, run_id: str) -> str:
+        return os.path.join(self.root, "runs", run_id)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def _manifest(self, run_id: str) -> Dict:
+        return self._manifests.setdefault(run_id, {"run_id": run_id, "created_at": time.time(),
+                                                   "files": {}, "history": {}})
+
+    def _put_blob(self, content: str) -> str:
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            self.submit(lambda: os.path.exists(path) or atomic_write(path, content))
+        return digest
+
+    def _link(self, digest: str, path: str, content: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        object_path = self._object_path(digest)
+        if os.path.exists(path) and os.path.exists(object_path) and os.path.samefile(path, object_path):
+            return
+        tmp_path = f"{path}.{digest[:8]}.tmp"
+        try:
+            os.link(object_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            atomic_write(path, content)
+        finally:
+            # Renaming onto a link to the same inode is a no-op that leaves the temp name behind
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+
+    # Public API
+
+    def put(self, run_id: str, name: str, content: str, mirror: Optional[str] = None) -> str:
+        """Store a run file by content hash; optionally also write it atomically to a plain path."""
+        with self._lock:
+            digest = self._put_blob(content)
+            self._manifest(run_id)["files"][name] = digest
+        # Readable view of the run's files, isolated from other runs; hard links share the blob's storage
+        self.submit(lambda: self._link(digest, os.path.join(self.run_dir(run_id), "files", name), content))
+        if mirror:
+            self.submit(lambda: atomic_write(mirror, content))
+        return digest
+
+    def record_version(self, run_id: str, name: str, content: str) -> int:
+        """Append a version of a file (e.g. each code iteration) to the run's history."""
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        with self._lock:
+            history = self._manifest(run_id)["history"].setdefault(name, [])
+            if history and history[-1]["sha256"] == digest:
+                return len(history) - 1
+            if history:
+                delta = line_delta(self._latest[(run_id, name)], content)
+                history.append({"sha256": digest, "delta": self._put_blob(json.dumps(delta, separators=(",", ":")))})
+            else:
+                history.append({"sha256": self._put_blob(content), "full": True})
+            self._latest[(run_id, name)] = content
+            return len(history) - 1
+
+    def read_blob(self, digest: str) -> str:
+        with open(self._object_path(digest)) as f:
+            return f.read()
+
+    def load_version(self, run_id: str, name: str, version: int = -1) -> str:
+        """Rebuild a version of a file from the persisted manifest and deltas."""
+        with open(os.path.join(self.run_dir(run_id), "manifest.json")) as f:
+            history = json.load(f)["history"][name]
+        version = version % len(history)
+        text = self.read_blob(history[0]["sha256"])
+        for entry in history[1:version + 1]:
+            text = apply_delta(text, json.loads(self.read_blob(entry["delta"])))
+        return text
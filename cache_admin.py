@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional
+
+# The on-disk LLM cache is a diskcache store written by AutoGen at
+# .cache/<cache_seed>/cache.db. We talk to the SQLite file directly so the
+# maintenance commands work without importing autogen.
+DEFAULT_CACHE_DIR = ".cache"
+DEFAULT_SEED = os.getenv("LLM_CACHE_SEED", "41")
+
+# First line of each agent's system message (see MultiAgentCodingSystem)
+AGENT_SIGNATURES = {
+    "You are a requirement analysis expert.": "RequirementAnalyst",
+    "You are an expert Python developer.": "CodeDeveloper",
+    "You are a senior code reviewer.": "CodeReviewer",
+    "You are a documentation specialist.": "DocumentationSpecialist",
+    "You are a test engineering expert.": "TestEngineer",
+    "You are a Streamlit UI development expert.": "StreamlitUIDesigner",
+}
+
+
+def cache_db_path(cache_dir: str = DEFAULT_CACHE_DIR, seed: str = DEFAULT_SEED) -> str:
+    """Return the path of the cache database for a cache seed."""
+    return os.path.join(cache_dir, str(seed), "cache.db")
+
+
+def open_cache(path: str) -> sqlite3.Connection:
+    """Open an existing cache database."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No cache database at {path}")
+    conn = sqlite3.connect(path, timeout=60)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def agent_for_key(key: str) -> str:
+    """Work out which agent produced a cache key from its system message."""
+    try:
+        messages = json.loads(key).get("messages", [])
+    except (ValueError, AttributeError):
+        return "unknown"
+    for message in messages:
+        if message.get("role") == "system":
+            content = (message.get("content") or "").strip()
+            for signature, agent in AGENT_SIGNATURES.items():
+                if content.startswith(signature):
+                    return agent
+    return "unknown"
+
+
+def describe_key(key: str, width: int = 60) -> str:
+    """Short, single-line preview of the user prompt stored in a key."""
+    try:
+        messages = json.loads(key).get("messages", [])
+        prompt = next((m.get("content") or "" for m in messages if m.get("role") == "user"), "")
+    except (ValueError, AttributeError):
+        prompt = str(key)
+    prompt = " ".join(prompt.split())
+    return prompt[:width] + ("..." if len(prompt) > width else "")
+
+
+def _entry_bytes_sql() -> str:
+    # Small values are pickled inline (size stays 0), large ones live in files
+    return "(IFNULL(LENGTH(key), 0) + IFNULL(LENGTH(value), 0) + IFNULL(size, 0))"
+
+
+def _settings(conn: sqlite3.Connection) -> Dict:
+    return {row["key"]: row["value"] for row in conn.execute("SELECT key, value FROM Settings")}
+
+
+def cache_stats(conn: sqlite3.Connection, top: int = 5) -> Dict:
+    """Collect entry counts, bytes, hit ratio, age and hot keys per agent."""
+    now = time.time()
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    settings = _settings(conn)
+    rows = conn.execute(
+        f"SELECT rowid, key, store_time, access_time, access_count, {_entry_bytes_sql()} AS bytes FROM Cache"
+    ).fetchall()
+
+    agents: Dict[str, Dict] = {}
+    for row in rows:
+        agent = agent_for_key(row["key"])
+        info = agents.setdefault(agent, {"entries": 0, "bytes": 0, "hits": 0, "keys": []})
+        info["entries"] += 1
+        info["bytes"] += row["bytes"]
+        info["hits"] += row["access_count"] or 0
+        info["keys"].append((row["access_count"] or 0, row["rowid"], describe_key(row["key"])))
+
+    for info in agents.values():
+        info["keys"].sort(key=lambda item: (-item[0], item[1]))
+        info["hot_keys"] = [{"rowid": rowid, "hits": hits, "prompt": prompt}
+                            for hits, rowid, prompt in info.pop("keys")[:top]]
+
+    # diskcache only counts hits/misses when statistics are enabled; otherwise
+    # every stored entry stands for one miss and access_count for its hits.
+    entries = len(rows)
+    if settings.get("statistics"):
+        hits, misses = settings.get("hits", 0), settings.get("misses", 0)
+    else:
+        hits, misses = sum(info["hits"] for info in agents.values()), entries
+    lookups = hits + misses
+
+    store_times = [row["store_time"] for row in rows if row["store_time"]]
+    return {
+        "path": path,
+        "entries": entries,
+        "bytes": sum(row["bytes"] for row in rows),
+        "file_bytes": os.path.getsize(path),
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / lookups if lookups else 0.0,
+        "oldest_age_s": now - min(store_times) if store_times else 0.0,
+        "newest_age_s": now - max(store_times) if store_times else 0.0,
+        "agents": agents,
+    }
+
+
+def _delete_rows(conn: sqlite3.Connection, rowids: List[int], cache_path: str) -> int:
+    """Delete cache rows and any value files diskcache kept beside the database."""
+    if not rowids:
+        return 0
+    cache_root = os.path.dirname(cache_path)
+    with conn:
+        for rowid in rowids:
+            row = conn.execute("SELECT filename FROM Cache WHERE rowid = ?", (rowid,)).fetchone()
+            conn.execute("DELETE FROM Cache WHERE rowid = ?", (rowid,))
+            if row and row["filename"]:
+                try:
+                    os.remove(os.path.join(cache_root, row["filename"]))
+                except OSError:
+                    pass
+    return len(rowids)
+
+
+def prune_cache(conn: sqlite3.Connection, cache_path: str, older_than: Optional[float] = None,
+                max_bytes: Optional[int] = None, keep: Optional[int] = None,
+                dry_run: bool = False) -> List[int]:
+    """Evict entries by age, total size (LRU first) or entry count (LRU first)."""
+    now = time.time()
+    # Least recently used first
+    rows = conn.execute(
+        f"SELECT rowid, store_time, access_time, {_entry_bytes_sql()} AS bytes "
+        "FROM Cache ORDER BY IFNULL(access_time, store_time) ASC, rowid ASC"
+    ).fetchall()
+
+    doomed = set()
+    if older_than is not None:
+        doomed.update(row["rowid"] for row in rows if (row["store_time"] or 0) < now - older_than)
+
+    survivors = [row for row in rows if row["rowid"] not in doomed]
+    if keep is not None and len(survivors) > keep:
+        excess = survivors[:len(survivors) - keep]
+        doomed.update(row["rowid"] for row in excess)
+        survivors = survivors[len(excess):]
+
+    if max_bytes is not None:
+        total = sum(row["bytes"] for row in survivors)
+        for row in survivors:
+            if total <= max_bytes:
+                break
+            doomed.add(row["rowid"])
+            total -= row["bytes"]
+
+    victims = sorted(doomed)
+    if not dry_run:
+        _delete_rows(conn, victims, cache_path)
+    return victims
+
+
+def compact_cache(conn: sqlite3.Connection) -> Dict:
+    """Checkpoint the WAL and VACUUM the database; return sizes before and after."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    before = os.path.getsize(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return {"before": before, "after": os.path.getsize(path)}
+
+
+def load_history(path: str) -> List[str]:
+    """Read requirements from a run history file (JSONL or one requirement per line)."""
+    requirements = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                requirements.append(line)
+                continue
+            if isinstance(record, dict):
+                text = record.get("requirement") or record.get("body")
+                if text:
+                    requirements.append(text)
+            elif isinstance(record, str):
+                requirements.append(record)
+    return requirements
+
+
+def warm_cache(history_path: str, seed: str = DEFAULT_SEED, limit: Optional[int] = None) -> int:
+    """Run the pipeline for each historical requirement with caching enabled."""
+    os.environ["LLM_CACHE_SEED"] = str(seed)
+    from main import MultiAgentCodingSystem
+
+    requirements = load_history(history_path)[:limit]
+    system = MultiAgentCodingSystem()
+    for index, requirement in enumerate(requirements, 1):
+        print(f"Warming {index}/{len(requirements)}: {' '.join(requirement.split())[:60]}")
+        system.run_full_pipeline(requirement)
+    return len(requirements)
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+
+
+def _format_age(seconds: float) -> str:
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds / 86400:.1f}d"
+
+
+def _parse_age(text: str) -> float:
+    """Parse ages like 90s, 30m, 12h or 7d into seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def _parse_size(text: str) -> int:
+    """Parse sizes like 500K, 200M or 1G into bytes."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def print_stats(stats: Dict):
+    """Print a cache report."""
+    print(f"Cache: {stats['path']}")
+    print(f"  entries:   {stats['entries']}")
+    print(f"  data:      {_format_bytes(stats['bytes'])} (file {_format_bytes(stats['file_bytes'])})")
+    print(f"  hit ratio: {stats['hit_ratio']:.1%} ({stats['hits']} hits / {stats['misses']} misses)")
+    if stats["entries"]:
+        print(f"  age:       oldest {_format_age(stats['oldest_age_s'])}, newest {_format_age(stats['newest_age_s'])}")
+    for agent, info in sorted(stats["agents"].items(), key=lambda item: -item[1]["bytes"]):
+        print(f"\n  [{agent}] {info['entries']} entries, {_format_bytes(info['bytes'])}, {info['hits']} hits")
+        for hot in info["hot_keys"]:
+            print(f"    #{hot['rowid']:<5} {hot['hits']:>4} hits  {hot['prompt']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the on-disk LLM cache.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--seed", default=DEFAULT_SEED, help="cache_seed the cache was written with")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats_cmd = commands.add_parser("stats", help="report entries, bytes, hit ratio and hot keys by agent")
+    stats_cmd.add_argument("--top", type=int, default=5)
+    stats_cmd.add_argument("--json", action="store_true")
+
+    prune_cmd = commands.add_parser("prune", help="evict entries by age, size or LRU")
+    prune_cmd.add_argument("--older-than", type=_parse_age, help="e.g. 7d, 12h")
+    prune_cmd.add_argument("--max-bytes", type=_parse_size, help="evict LRU entries until under, e.g. 200M")
+    prune_cmd.add_argument("--keep", type=int, help="keep only the N most recently used entries")
+    prune_cmd.add_argument("--dry-run", action="store_true")
+    prune_cmd.add_argument("--compact", action="store_true", help="vacuum after pruning")
+
+    commands.add_parser("compact", help="checkpoint and vacuum the database")
+
+    warm_cmd = commands.add_parser("warm", help="replay requirements from a run history through the pipeline")
+    warm_cmd.add_argument("history", help="JSONL file with 'requirement' (or 'body') fields")
+    warm_cmd.add_argument("--limit", type=int)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "warm":
+        count = warm_cache(args.history, seed=args.seed, limit=args.limit)
+        print(f"Warmed cache with {count} requirement(s)")
+        return 0
+
+    path = cache_db_path(args.cache_dir, args.seed)
+    try:
+        conn = open_cache(path)
+    except FileNotFoundError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+    if args.command == "stats":
+        stats = cache_stats(conn, top=args.top)
+        if args.json:
+            print(json.dumps(stats, indent=2))
+        else:
+            print_stats(stats)
+    elif args.command == "prune":
+        if args.older_than is None and args.max_bytes is None and args.keep is None:
+            parser.error("prune needs --older-than, --max-bytes and/or --keep")
+        victims = prune_cache(conn, path, older_than=args.older_than, max_bytes=args.max_bytes,
+                              keep=args.keep, dry_run=args.dry_run)
+        verb = "Would evict" if args.dry_run else "Evicted"
+        print(f"{verb} {len(victims)} entr{'y' if len(victims) == 1 else 'ies'}")
+        if args.compact and not args.dry_run:
+            sizes = compact_cache(conn)
+            print(f"Compacted {_format_bytes(sizes['before'])} -> {_format_bytes(sizes['after'])}")
+    elif args.command == "compact":
+        sizes = compact_cache(conn)
+        print(f"Compacted {_format_bytes(sizes['before'])} -> {_format_bytes(sizes['after'])}")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
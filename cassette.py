@@ -0,0 +1,97 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, List
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(LookupError):
+    """A replayed conversation asked for a call the cassette does not contain."""
+
+
+def request_key(agent_name: str, message: str) -> str:
+    return hashlib.sha256(f"{agent_name}\0{message}".encode()).hexdigest()[:32]
+
+
+class Cassette:
+    """Records agent conversations to a compact file and replays them offline.
+
+    The file is gzip-compressed JSON lines, one per agent call. Each record is
+    appended as its own gzip member as soon as the call finishes, so a crashed
+    run still leaves a usable cassette.
+
+    Replay looks calls up by agent and exact prompt first. If the prompt
+    changed (e.g. while working on the orchestration code) it falls back to
+    that agent's next unused call in recorded order.
+    """
+
+    def __init__(self, path: str, mode: str = REPLAY, replay_timing: bool = False):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.replay_timing = replay_timing
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, deque] = defaultdict(deque)
+        self._by_agent: Dict[str, deque] = defaultdict(deque)
+        self._used = set()
+
+        if mode == REPLAY:
+            for index, record in enumerate(self.load(path)):
+                record["index"] = index
+                self._by_key[record["key"]].append(record)
+                self._by_agent[record["agent"]].append(record)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            open(path, "wb").close()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    @staticmethod
+    def load(path: str) -> List[Dict]:
+        """Read all records of a cassette file."""
+        with gzip.open(path, "rt") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def record(self, agent_name: str, message: str, response: str, seconds: float):
+        """Append one agent call to the cassette."""
+        record = {
+            "agent": agent_name,
+            "key": request_key(agent_name, message),
+            "request": message,
+            "response": response,
+            "seconds": round(seconds, 3),
+        }
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock, gzip.open(self.path, "at") as f:
+            f.write(line)
+
+    def replay(self, agent_name: str, message: str) -> str:
+        """Return the recorded response for a call, optionally after its original duration."""
+        with self._lock:
+            record = self._take(self._by_key[request_key(agent_name, message)])
+            if record is None:
+                record = self._take(self._by_agent[agent_name])
+                if record is None:
+                    raise CassetteMiss(f"No recorded call left for {agent_name} in {self.path}")
+                self.misses += 1
+        if self.replay_timing:
+            time.sleep(record["seconds"])
+        return record["response"]
+
+    def _take(self, queue: deque):
+        while queue:
+            record = queue.popleft()
+            if record["index"] not in self._used:
+                self._used.add(record["index"])
+                return record
+        return None
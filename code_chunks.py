@@ -0,0 +1,106 @@
+import ast
+from typing import Dict, List
+
+from context_budget import estimate_tokens
+from project_layout import is_project_bundle, split_project
+
+# Review chunks aim for this many tokens of code (plus the shared header)
+DEFAULT_CHUNK_TOKENS = 1200
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def _segment(lines: List[str], node: ast.AST) -> str:
+    start = node.lineno - 1
+    # Keep decorators with their definition
+    for decorator in getattr(node, "decorator_list", []):
+        start = min(start, decorator.lineno - 1)
+    return "\n".join(lines[start:node.end_lineno])
+
+
+def _signature(lines: List[str], node: ast.AST) -> str:
+    return lines[node.lineno - 1].strip()
+
+
+def _context_header(path: str, lines: List[str], tree: ast.Module) -> str:
+    """Imports, module-level constants and an outline of every definition in the file."""
+    context = [f"# File: {path}"]
+    outline = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.Assign, ast.AnnAssign)):
+            context.append(_segment(lines, node))
+        elif isinstance(node, ast.ClassDef):
+            outline.append(_signature(lines, node))
+            outline.extend("    " + _signature(lines, item) for item in node.body if isinstance(item, _DEFINITIONS))
+        elif isinstance(node, _DEFINITIONS):
+            outline.append(_signature(lines, node))
+    if outline:
+        context.append("# Outline of the file:\n" + "\n".join(f"#   {line}" for line in outline))
+    return "\n".join(context)
+
+
+def _units(lines: List[str], tree: ast.Module, max_tokens: int) -> List[Dict]:
+    """Reviewable units of a file: functions, classes (split by method if large) and top-level code."""
+    units = []
+    loose = []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and estimate_tokens(_segment(lines, node)) > max_tokens:
+            class_line = _signature(lines, node)
+            for item in node.body:
+                if isinstance(item, _DEFINITIONS):
+                    units.append({"name": f"{node.name}.{item.name}",
+                                  "source": f"{class_line}\n    ...\n{_segment(lines, item)}"})
+        elif isinstance(node, _DEFINITIONS):
+            units.append({"name": node.name, "source": _segment(lines, node)})
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
+            continue  # docstring
+        elif not isinstance(node, (ast.Import, ast.ImportFrom, ast.Assign, ast.AnnAssign)):
+            loose.append(_segment(lines, node))
+    if loose:
+        units.append({"name": "module-level code", "source": "\n".join(loose)})
+    return units
+
+
+def split_code(code: str, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> List[Dict]:
+    """Split code into review chunks by module, class and function.
+
+    Each chunk carries a shared context header for its file (imports,
+    constants and an outline of the other definitions) so it can be reviewed
+    on its own.
+    """
+    files = split_project(code) if is_project_bundle(code) else {"main.py": code}
+    chunks = []
+    for path, source in files.items():
+        lines = source.splitlines()
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            # Unparseable code: fixed-size line windows without a header
+            step = max(20, len(lines) * max_tokens // max(1, estimate_tokens(source)))
+            for start in range(0, len(lines), step):
+                chunks.append({"path": path, "names": [f"lines {start + 1}-{min(len(lines), start + step)}"],
+                               "header": f"# File: {path}", "source": "\n".join(lines[start:start + step])})
+            continue
+
+        header = _context_header(path, lines, tree)
+        current: List[Dict] = []
+        size = 0
+        for unit in _units(lines, tree, max_tokens):
+            unit_tokens = estimate_tokens(unit["source"])
+            if current and size + unit_tokens > max_tokens:
+                chunks.append(_chunk(path, header, current))
+                current, size = [], 0
+            current.append(unit)
+            size += unit_tokens
+        if current or not chunks or chunks[-1]["path"] != path:
+            chunks.append(_chunk(path, header, current))
+    return chunks
+
+
+def _chunk(path: str, header: str, units: List[Dict]) -> Dict:
+    return {
+        "path": path,
+        "names": [unit["name"] for unit in units] or ["module"],
+        "header": header,
+        "source": "\n\n".join(unit["source"] for unit in units),
+    }
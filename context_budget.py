@@ -0,0 +1,205 @@
+import ast
+import json
+import math
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from project_layout import is_project_bundle, join_project, split_project
+from review_loop import parse_review_verdict
+
+# Context windows of the models we configure (tokens)
+MODEL_CONTEXT = {
+    "llama3-70b-8192": 8192,
+    "llama3-8b-8192": 8192,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT = 8192
+
+# Tokens kept free for each agent's reply
+AGENT_COMPLETION_RESERVE = {
+    "RequirementAnalyst": 1500,
+    "CodeDeveloper": 3000,
+    "CodeReviewer": 1500,
+    "DocumentationSpecialist": 2500,
+    "TestEngineer": 2500,
+    "StreamlitUIDesigner": 2500,
+}
+DEFAULT_COMPLETION_RESERVE = 2000
+
+# Our estimate is offline and approximate, so keep a margin
+SAFETY_MARGIN = 0.1
+
+_TOKEN_RE = re.compile(r"\n[ \t]*|[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of text without a tokenizer download.
+
+    Approximates BPE tokenizers: short words and numbers are one token, long
+    ones are split every few characters, each punctuation mark is a token and
+    a newline together with its indentation counts once.
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _TOKEN_RE.findall(text):
+        if piece[0].isalpha():
+            tokens += max(1, math.ceil(len(piece) / 6))
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+def context_limit(model: str) -> int:
+    """Context window for a model name, falling back to a trailing size suffix."""
+    if model in MODEL_CONTEXT:
+        return MODEL_CONTEXT[model]
+    match = re.search(r"-(\d{4,6})$", model or "")
+    return int(match.group(1)) if match else DEFAULT_CONTEXT
+
+
+def compress_requirements(requirements: str) -> str:
+    """Minify JSON requirements (or collapse whitespace if they are not JSON)."""
+    text = requirements.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.S)
+    candidate = fenced.group(1) if fenced else text
+    try:
+        return json.dumps(json.loads(candidate), separators=(",", ":"))
+    except ValueError:
+        return re.sub(r"[ \t]+", " ", re.sub(r"\n\s*\n+", "\n", text))
+
+
+_SUMMARY_NODES = (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef,
+                  ast.Assign, ast.AnnAssign)
+
+
+def _stub_body(node):
+    """Replace a function body with its docstring and an ellipsis; recurse into classes."""
+    docstring = node.body[:1] if ast.get_docstring(node) is not None else []
+    if isinstance(node, ast.ClassDef):
+        members = [_stub_body(n) if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) else n
+                   for n in node.body[len(docstring):] if isinstance(n, _SUMMARY_NODES)]
+        node.body = docstring + members or [ast.Expr(ast.Constant(...))]
+    else:
+        node.body = docstring + [ast.Expr(ast.Constant(...))]
+    return node
+
+
+def summarise_code(code: str) -> str:
+    """Reduce code to imports, signatures and docstrings."""
+    if is_project_bundle(code):
+        return join_project({path: summarise_code(source) for path, source in split_project(code).items()})
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        tree = None
+    if tree is None or not hasattr(ast, "unparse"):
+        lines = code.splitlines()
+        return "\n".join(lines[:40] + (["# ... (truncated)"] if len(lines) > 40 else []))
+
+    tree.body = [_stub_body(node) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) else node
+                 for node in tree.body if isinstance(node, _SUMMARY_NODES)]
+    return "# Summary: bodies omitted to fit the context window\n" + ast.unparse(tree)
+
+
+def trim_feedback(feedback: str) -> str:
+    """Keep only the issue list of a review, dropping the surrounding prose."""
+    verdict = parse_review_verdict(feedback)
+    if verdict.structured and verdict.issues:
+        return "\n".join(
+            f"- [{issue.severity}] {issue.location + ': ' if issue.location else ''}{issue.description}"
+            for issue in sorted(verdict.issues, key=lambda issue: not issue.blocking)
+        )
+    # Unstructured review: the conclusion is usually at the end
+    return feedback[-2000:]
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Binary search the longest prefix that fits
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "\n... (truncated)"
+
+
+# Degradation steps, applied in order while a prompt is over budget
+DEGRADATIONS: List[Tuple[str, str, Callable[[str], str]]] = [
+    ("requirements", "compressed requirements", compress_requirements),
+    ("code", "summarised code", summarise_code),
+    ("feedback", "dropped old feedback", trim_feedback),
+]
+
+
+class ContextBudget:
+    """Keeps agent prompts inside the model's context window."""
+
+    def __init__(self, model: str, limit: Optional[int] = None,
+                 reserves: Optional[Dict[str, int]] = None):
+        self.model = model
+        self.limit = limit or context_limit(model)
+        self.reserves = dict(AGENT_COMPLETION_RESERVE, **(reserves or {}))
+
+    def prompt_budget(self, agent_name: str, system_message: str = "") -> int:
+        """Tokens available for an agent's prompt after its system message and reply."""
+        reserve = self.reserves.get(agent_name, DEFAULT_COMPLETION_RESERVE)
+        usable = int(self.limit * (1 - SAFETY_MARGIN))
+        return usable - reserve - estimate_tokens(system_message)
+
+    def fit(self, agent_name: str, render: Callable[..., str], system_message: str = "",
+            history_tokens: int = 0, **components: str) -> Tuple[str, Dict]:
+        """Render a prompt, degrading components in priority order until it fits.
+
+        ``render`` is called with the (possibly degraded) components as keyword
+        arguments; ``history_tokens`` is earlier conversation sent along with
+        the prompt. Returns the prompt and a usage report.
+        """
+        budget = self.prompt_budget(agent_name, system_message) - history_tokens
+        components = dict(components)
+        applied = []
+        message = render(**components)
+        tokens = estimate_tokens(message)
+
+        for name, label, degrade in DEGRADATIONS:
+            if tokens <= budget:
+                break
+            if not components.get(name):
+                continue
+            degraded = degrade(components[name])
+            if estimate_tokens(degraded) < estimate_tokens(components[name]):
+                components[name] = degraded
+                applied.append(label)
+                message = render(**components)
+                tokens = estimate_tokens(message)
+
+        # Last resort: cut the largest component until the prompt fits
+        while tokens > budget and components:
+            name = max(components, key=lambda key: estimate_tokens(components[key]))
+            size = estimate_tokens(components[name])
+            if size == 0:
+                break
+            components[name] = _truncate(components[name], max(0, size - (tokens - budget)))
+            applied.append(f"truncated {name}")
+            message = render(**components)
+            tokens = estimate_tokens(message)
+            if size - estimate_tokens(components[name]) <= 0:
+                break
+
+        report = {
+            "agent": agent_name,
+            "prompt_tokens": tokens + estimate_tokens(system_message) + history_tokens,
+            "budget": budget + estimate_tokens(system_message) + history_tokens,
+            "history_tokens": history_tokens,
+            "limit": self.limit,
+            "degradations": applied,
+        }
+        return message, report
@@ -0,0 +1,116 @@
+import os
+import re
+from typing import Dict, List, Set, Tuple
+
+from context_budget import estimate_tokens
+
+# How chat histories of the agents reused across calls are bounded:
+#   clear    every call starts from an empty history (default)
+#   stage    history is kept within a pipeline stage and cleared when the next one starts
+#   last     the last HISTORY_TURNS prompt/reply turns are kept for the rest of the run
+#   summary  as last, with older turns folded into one short summary message
+HISTORY_POLICY = os.getenv("HISTORY_POLICY", "clear")
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", "2"))
+# Upper bound on the history sent along with a prompt, whatever the policy
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1500"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+
+POLICIES = ("clear", "stage", "last", "summary")
+
+SUMMARY_PREFIX = "Summary of our earlier conversation:"
+_CODE_BLOCK = re.compile(r"```.*?(```|$)", re.S)
+
+
+def _tokens(messages: List[Dict]) -> int:
+    return sum(estimate_tokens(str(message.get("content") or "")) for message in messages)
+
+
+def _digest(message: Dict, width: int = 160) -> str:
+    """One line standing in for a message: its prose, with code blocks elided."""
+    text = str(message.get("content") or "")
+    if text.startswith(SUMMARY_PREFIX):
+        return text[len(SUMMARY_PREFIX):].strip()
+    text = " ".join(_CODE_BLOCK.sub(" [code] ", text).split())
+    return f"- {message.get('role', 'user')}: {text[:width]}{'...' if len(text) > width else ''}"
+
+
+def summarise_turns(messages: List[Dict], max_tokens: int) -> Dict:
+    """Fold messages into a single summary message of at most max_tokens (newest lines win)."""
+    lines = "\n".join(_digest(message) for message in messages).splitlines()
+    while lines and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return {"role": "user", "content": "\n".join([SUMMARY_PREFIX] + lines)}
+
+
+def bound_history(messages: List[Dict], policy: str, turns: int = HISTORY_TURNS,
+                  max_tokens: int = HISTORY_MAX_TOKENS, summary_tokens: int = HISTORY_SUMMARY_TOKENS) -> List[Dict]:
+    """The part of a chat history a policy keeps for the next call."""
+    if policy == "clear":
+        return []
+    kept = list(messages)
+    summary = None
+    if policy in ("last", "summary"):
+        keep = max(0, turns) * 2
+        older, kept = (kept[:-keep], kept[-keep:]) if keep else (kept, [])
+        if policy == "summary" and older:
+            summary = summarise_turns(older, summary_tokens)
+    # Drop whole turns, oldest first, until the history fits its token bound
+    while kept and _tokens(kept) + _tokens([summary] if summary else []) > max_tokens:
+        kept = kept[2:]
+    return ([summary] if summary else []) + kept
+
+
+class ConversationMemory:
+    """Bounds the chat histories of agents that are reused across calls and runs.
+
+    AutoGen keeps every message on both sides of a conversation. Agents are
+    built once and serve every run of a process (daemon, app, job worker),
+    so histories are trimmed after each call according to the policy and
+    always cleared at run boundaries; a process's memory and the history
+    serialised per call stay flat however many runs it serves.
+    """
+
+    def __init__(self, policy: str = HISTORY_POLICY, turns: int = HISTORY_TURNS,
+                 max_tokens: int = HISTORY_MAX_TOKENS, summary_tokens: int = HISTORY_SUMMARY_TOKENS):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown history policy {policy!r}; expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.turns = turns
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        # Conversations currently holding history, to clear at stage and run boundaries
+        self._pairs: Set[Tuple] = set()
+
+    @property
+    def clears_each_call(self) -> bool:
+        return self.policy == "clear"
+
+    def history_tokens(self, sender, agent) -> int:
+        """Tokens of history the next call from sender to agent sends along."""
+        if self.clears_each_call:
+            return 0
+        return _tokens(agent.chat_messages.get(sender, []))
+
+    def after_call(self, sender, agent):
+        """Trim both sides of a conversation after a call."""
+        if self.clears_each_call:
+            sender.clear_history(agent)
+            agent.clear_history(sender)
+            return
+        for owner, partner in ((sender, agent), (agent, sender)):
+            messages = owner.chat_messages.get(partner)
+            if messages is not None:
+                messages[:] = bound_history(messages, self.policy, self.turns, self.max_tokens, self.summary_tokens)
+        self._pairs.add((sender, agent))
+
+    def clear(self):
+        """Forget every conversation, e.g. between runs."""
+        for sender, agent in self._pairs:
+            sender.clear_history(agent)
+            agent.clear_history(sender)
+        self._pairs.clear()
+
+    def on_span(self, phase: str, name: str, cat: str, args: Dict):
+        """Tracer listener clearing histories when a stage starts (stage policy)."""
+        if self.policy == "stage" and cat == "stage" and phase == "begin":
+            self.clear()
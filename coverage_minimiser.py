@@ -0,0 +1,236 @@
+import ast
+import importlib.util
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from project_layout import is_project_bundle, split_project
+from test_runner import DEFAULT_MEMORY_MB, DEFAULT_TIMEOUT, collect_test_ids, prepare_workspace, run_sandboxed
+from tracing import span, wrap
+
+TEST_MODULE = "test_main.py"
+
+# Runs in the sandbox: the pytest arguments (the suite, or single tests) once under
+# coverage, with each line attributed to the test functions that executed it;
+# prints a JSON report last
+_COVERAGE_SCRIPT = """
+import json, os
+import coverage
+test_module = sys.argv[3].split("::")[0]
+cov = coverage.Coverage(data_file=None, source=[os.getcwd()], omit=["*/" + test_module, "*/conftest.py"],
+                        config_file=False)
+cov.set_option("run:dynamic_context", "test_function")
+
+class Outcomes:
+    def __init__(self):
+        self.outcomes = {}
+    def pytest_runtest_logreport(self, report):
+        if report.failed:
+            self.outcomes[report.nodeid] = "failed"
+        elif report.when == "call":
+            self.outcomes.setdefault(report.nodeid, report.outcome)
+
+outcomes = Outcomes()
+cov.start()
+import pytest
+returncode = pytest.main(["-q", "-p", "no:cacheprovider", "--no-header", *sys.argv[3:]], plugins=[outcomes])
+cov.stop()
+data = cov.get_data()
+files = {}
+for root, _, filenames in os.walk(os.getcwd()):
+    for name in filenames:
+        path = os.path.join(root, name)
+        if not name.endswith(".py") or name in (test_module, "conftest.py"):
+            continue
+        contexts = data.contexts_by_lineno(path) if path in data.measured_files() else {}
+        files[os.path.relpath(path)] = {
+            "statements": cov.analysis2(path)[1],
+            "contexts": {str(line): sorted(name for name in line_contexts if name)
+                         for line, line_contexts in contexts.items()},
+        }
+print(json.dumps({"returncode": int(returncode), "outcomes": outcomes.outcomes, "files": files}))
+"""
+
+
+def coverage_available() -> bool:
+    """Whether the optional coverage package is installed (the sandbox uses this interpreter)."""
+    return importlib.util.find_spec("coverage") is not None
+
+
+def _test_id(context: str, filename: str = TEST_MODULE) -> str:
+    """Node id of a coverage test_function context, e.g. test_main.TestX.test_y -> test_main.py::TestX::test_y."""
+    module = filename[:-3].replace("/", ".")
+    return f"{filename}::{context[len(module) + 1:].replace('.', '::')}" if context.startswith(module + ".") else context
+
+
+def _run_coverage(workspace: str, args: List[str], timeout: float, memory_mb: int) -> Tuple[Optional[Dict], str]:
+    """One sandboxed coverage run of pytest with args; returns its report, or None and why it failed."""
+    completed = run_sandboxed(workspace, _COVERAGE_SCRIPT, args, timeout=timeout, memory_mb=memory_mb)
+    lines = completed["stdout"].strip().splitlines()
+    try:
+        measured = json.loads(lines[-1]) if lines else None
+    except ValueError:
+        measured = None
+    if not measured:
+        return None, "timeout" if completed["returncode"] is None else (completed["stderr"] or "no output")[-800:]
+    if measured["returncode"] not in (0, 1):
+        # Collection or usage error: no test ran, so there is nothing to measure
+        return None, f"pytest exited with code {measured['returncode']}:\n" + "\n".join(lines[:-1])[-800:]
+    return measured, ""
+
+
+def measure_coverage(code: str, tests: str, skip: Iterable[str] = (), timeout: float = DEFAULT_TIMEOUT * 4,
+                     memory_mb: int = DEFAULT_MEMORY_MB) -> Dict:
+    """Run the suite once under coverage in the sandbox.
+
+    Returns per test function its outcome (parametrized cases combined) and
+    the (file, line) pairs it executed, plus every file's statements and the
+    lines executed at all (including at import time, outside any test).
+    Tests in skip (e.g. known to hang) are deselected and reported as not
+    run. If the suite run times out or crashes, each test is measured in its
+    own run, so one bad test only loses its own coverage.
+    """
+    test_ids = collect_test_ids(tests, TEST_MODULE)
+    skip = [test_id for test_id in skip if test_id in test_ids]
+    deselect = [arg for test_id in skip for arg in ("--deselect", test_id)]
+    results = {test_id: {"outcome": "not run", "lines": set()} for test_id in test_ids}
+    workspace = prepare_workspace(code, tests, TEST_MODULE)
+    try:
+        with span("measure coverage", cat="test"):
+            measured, error = _run_coverage(workspace, [TEST_MODULE, *deselect], timeout, memory_mb)
+            runs = [measured] if measured else []
+            if measured is None and not error.startswith("pytest exited"):
+                # The suite hung or crashed: measure the tests one by one instead
+                remaining = [test_id for test_id in test_ids if test_id not in skip]
+                with ThreadPoolExecutor(max_workers=min(len(remaining), os.cpu_count() or 1) or 1) as executor:
+                    single = list(executor.map(wrap(lambda test_id: _run_coverage(
+                        workspace, [test_id], DEFAULT_TIMEOUT, memory_mb)), remaining))
+                for test_id, (test_measured, test_error) in zip(remaining, single):
+                    if test_measured:
+                        runs.append(test_measured)
+                    else:
+                        results[test_id]["outcome"] = "timeout" if test_error == "timeout" else "error"
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    if not runs:
+        return {"error": error if error.startswith("pytest exited") else f"coverage run failed: {error}"}
+
+    statements, covered = {}, set()
+    for measured in runs:
+        for node_id, outcome in measured["outcomes"].items():
+            test_id = node_id.split("[", 1)[0]
+            if test_id in results and results[test_id]["outcome"] in ("not run", "passed"):
+                results[test_id]["outcome"] = outcome
+        for path, info in measured["files"].items():
+            statements[path] = info["statements"]
+            for line, contexts in info["contexts"].items():
+                covered.add((path, int(line)))
+                for context in contexts:
+                    if _test_id(context) in results:
+                        results[_test_id(context)]["lines"].add((path, int(line)))
+    return {"error": None, "tests": results, "statements": statements, "covered": covered}
+
+
+def coverage_ratio(measured: Dict, test_ids: Optional[Iterable[str]] = None) -> float:
+    """Share of statements executed; with test_ids, only by those tests (and at import time)."""
+    covered = measured["covered"]
+    if test_ids is not None:
+        tests = measured["tests"]
+        by_any_test = set().union(*(result["lines"] for result in tests.values()))
+        covered = (covered - by_any_test).union(*(tests[test_id]["lines"] for test_id in test_ids))
+    total = sum(len(lines) for lines in measured["statements"].values())
+    hit = sum(1 for path, line in covered if line in measured["statements"].get(path, ()))
+    return hit / total if total else 1.0
+
+
+def select_tests(measured: Dict, keep: Iterable[str], candidates: Optional[Iterable[str]] = None) -> List[str]:
+    """Greedy set cover: the kept tests plus the fewest candidates reaching all the lines candidates reach.
+
+    Candidates default to the passing tests. Each step takes the candidate
+    adding the most lines not yet covered (the earliest in the file on ties);
+    candidates adding nothing are left out.
+    """
+    tests = measured["tests"]
+    selected = [test_id for test_id in tests if test_id in set(keep)]
+    if candidates is None:
+        candidates = [test_id for test_id, result in tests.items() if result["outcome"] == "passed"]
+    have: Set[Tuple[str, int]] = set().union(*(tests[test_id]["lines"] for test_id in selected))
+    remaining = {test_id: tests[test_id]["lines"] - have for test_id in candidates if test_id not in selected}
+    while remaining:
+        best = max(remaining, key=lambda test_id: len(remaining[test_id]))
+        if not remaining[best]:
+            break
+        selected.append(best)
+        have |= tests[best]["lines"]
+        del remaining[best]
+        remaining = {test_id: lines - have for test_id, lines in remaining.items()}
+    order = list(tests)
+    return sorted(selected, key=order.index)
+
+
+def remove_tests(tests: str, test_ids: Iterable[str], filename: str = TEST_MODULE) -> str:
+    """Delete test functions and methods (and classes left without tests) from a test module's source."""
+    test_ids = set(test_ids)
+    if not test_ids:
+        return tests
+    tree = ast.parse(tests)
+    spans = []
+
+    def node_span(node) -> Tuple[int, int]:
+        return min([node.lineno] + [decorator.lineno for decorator in node.decorator_list]), node.end_lineno
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and f"{filename}::{node.name}" in test_ids:
+            spans.append(node_span(node))
+        elif isinstance(node, ast.ClassDef):
+            methods = [item for item in node.body if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))
+                       and item.name.startswith("test")]
+            removed = [item for item in methods if f"{filename}::{node.name}::{item.name}" in test_ids]
+            if methods and len(removed) == len(methods):
+                spans.append(node_span(node))
+            else:
+                spans.extend(node_span(item) for item in removed)
+    lines = tests.splitlines()
+    for start, end in sorted(spans, reverse=True):
+        del lines[start - 1:end]
+    return re.sub(r"\n{3,}", "\n\n\n", "\n".join(lines)).strip() + "\n"
+
+
+def format_uncovered(measured: Dict, code: str, limit: int = 60) -> str:
+    """Uncovered statements with their source, grouped by file, for the test agent."""
+    sources = split_project(code) if is_project_bundle(code) else {"main.py": code}
+    lines, shown = [], 0
+    for path, statements in sorted(measured["statements"].items()):
+        missing = [line for line in statements if (path, line) not in measured["covered"]]
+        source = sources.get(path, "").splitlines()
+        if not missing or not source:
+            continue
+        lines.append(f"{path}:")
+        for line in missing:
+            if shown == limit:
+                lines.append("... and more uncovered lines")
+                return "\n".join(lines)
+            lines.append(f"  {line:>4}: {source[line - 1].rstrip() if line <= len(source) else ''}")
+            shown += 1
+    return "\n".join(lines)
+
+
+def merge_tests(tests: str, extra: str, filename: str = TEST_MODULE,
+                comment: str = "Coverage top-up") -> Tuple[str, List[str]]:
+    """Append new tests to a module, renaming those whose names are taken; returns the ids of the new tests."""
+    try:
+        existing = {node.name for node in ast.parse(tests).body
+                    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))}
+        new = [node.name for node in ast.parse(extra).body
+               if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))]
+    except SyntaxError:
+        return tests, []
+    for name in new:
+        if name in existing:
+            extra = re.sub(rf"^((?:async\s+)?(?:def|class)\s+){name}\b", rf"\g<1>{name}_topup", extra, flags=re.M)
+    merged = f"{tests.rstrip()}\n\n\n# {comment}\n{extra.strip()}\n"
+    before = set(collect_test_ids(tests, filename))
+    return merged, [test_id for test_id in collect_test_ids(merged, filename) if test_id not in before]
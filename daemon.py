@@ -0,0 +1,233 @@
+import argparse
+import contextvars
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, TextIO
+
+from scheduler import default_scheduler
+
+# Unix socket of the warm pipeline daemon
+DAEMON_SOCKET = os.getenv("AGENT_DAEMON_SOCKET", "output/agentd.sock")
+
+# Where print() output of the run executing in this context goes
+_output_sink: contextvars.ContextVar = contextvars.ContextVar("output_sink", default=None)
+
+
+class DaemonUnavailable(ConnectionError):
+    """No daemon is listening on the socket."""
+
+
+class OutputRouter:
+    """sys.stdout replacement sending each run's output to its own sink (see route_output).
+
+    Worker threads started through tracing.wrap() inherit the run's
+    context, so their output is routed too. Anything else goes to the
+    process's own stdout.
+    """
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    def write(self, text: str) -> int:
+        sink = _output_sink.get()
+        if sink is None:
+            return self.stream.write(text)
+        sink(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def install_output_router():
+    """Replace sys.stdout with an OutputRouter (once per process)."""
+    if not isinstance(sys.stdout, OutputRouter):
+        sys.stdout = OutputRouter(sys.stdout)
+
+
+@contextmanager
+def route_output(sink: Callable[[str], None]):
+    """Send everything printed in this context to sink."""
+    token = _output_sink.set(sink)
+    try:
+        yield
+    finally:
+        _output_sink.reset(token)
+
+
+def _send_line(conn: socket.socket, lock: threading.Lock, message: Dict) -> bool:
+    data = (json.dumps(message, default=str) + "\n").encode()
+    with lock:
+        try:
+            conn.sendall(data)
+            return True
+        except OSError:
+            # The client went away; the run still finishes and is recorded
+            return False
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server: "PipelineDaemon" = self.server
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+        except ValueError:
+            request = {}
+        lock = threading.Lock()
+        send = lambda message: _send_line(self.connection, lock, message)
+
+        if request.get("command") == "ping":
+            send({"type": "pong", "pid": os.getpid(), "runs": server.runs, "idle": server.pool.qsize()})
+            return
+        if request.get("command") != "run" or not isinstance(request.get("requirement"), str):
+            send({"type": "error", "error": "expected {\"command\": \"run\", \"requirement\": ...}"})
+            return
+
+        system = server.pool.get()
+        try:
+            with route_output(lambda text: send({"type": "output", "text": text})):
+                results = system.run_full_pipeline(request["requirement"])
+            send({"type": "result", "results": results})
+        except Exception as e:
+            send({"type": "error", "error": repr(e)})
+        finally:
+            # The ledger already has this run's calls; keep a long-lived system from growing
+            system.call_log.clear()
+            server.runs += 1
+            server.pool.put(system)
+
+
+class PipelineDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Long-lived process keeping agents, HTTP connection pools and caches warm.
+
+    Holds `workers` pipeline systems; each request borrows one for a full
+    run, so up to `workers` requirements are processed concurrently.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, factory: Callable, workers: int = 1):
+        self.socket_path = socket_path
+        self.runs = 0
+        self.pool: "queue.Queue" = queue.Queue()
+        # Several runs in flight share the LLM slots with the app and job workers
+        scheduler = default_scheduler(workers)
+        for _ in range(workers):
+            self.pool.put(factory(scheduler=scheduler))
+        _remove_stale_socket(socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_stale_socket(socket_path: str):
+    """Delete a socket file left by a dead daemon; refuse to replace a live one."""
+    if not os.path.exists(socket_path):
+        return
+    try:
+        ping(socket_path)
+    except DaemonUnavailable:
+        os.remove(socket_path)
+    else:
+        raise RuntimeError(f"A daemon is already listening on {socket_path}")
+
+
+def serve(socket_path: str = DAEMON_SOCKET, workers: int = 1):
+    """Build the pipeline once and serve requirements until interrupted."""
+    from main import Colors, MultiAgentCodingSystem, print_step
+
+    server = PipelineDaemon(socket_path, MultiAgentCodingSystem, workers)
+    install_output_router()
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print_step("Daemon", f"{Colors.GREEN}Ready{Colors.ENDC} on {socket_path} ({workers} worker(s), pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _connect(socket_path: str) -> socket.socket:
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError as e:
+        conn.close()
+        raise DaemonUnavailable(f"No daemon on {socket_path} ({e})") from e
+    return conn
+
+
+def _request(socket_path: str, request: Dict):
+    """Send one request and yield the daemon's reply messages."""
+    with _connect(socket_path) as conn, conn.makefile("rb") as replies:
+        conn.sendall((json.dumps(request) + "\n").encode())
+        for line in replies:
+            yield json.loads(line)
+
+
+def ping(socket_path: str = DAEMON_SOCKET) -> Dict:
+    return next(_request(socket_path, {"command": "ping"}))
+
+
+def submit(requirement: str, socket_path: str = DAEMON_SOCKET, out: Optional[TextIO] = None) -> Dict:
+    """Run a requirement on the daemon, streaming its output to `out`; return the results."""
+    out = out or sys.stdout
+    for message in _request(socket_path, {"command": "run", "requirement": requirement}):
+        if message["type"] == "output":
+            out.write(message["text"])
+            out.flush()
+        elif message["type"] == "result":
+            return message["results"]
+        else:
+            raise RuntimeError(f"Daemon run failed: {message.get('error')}")
+    raise ConnectionError("Daemon closed the connection before the run finished")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Warm pipeline daemon and its client.")
+    parser.add_argument("--socket", default=DAEMON_SOCKET)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="start the daemon in the foreground")
+    serve_parser.add_argument("--workers", type=int, default=1, help="concurrent runs")
+    commands.add_parser("submit", help="run requirements read from stdin on the daemon")
+    commands.add_parser("ping", help="check that the daemon is up")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.socket, args.workers)
+        return 0
+    try:
+        if args.command == "ping":
+            print(json.dumps(ping(args.socket)))
+            return 0
+        results = submit(sys.stdin.read(), args.socket)
+    except DaemonUnavailable as e:
+        print(f"{e}; start one with: python daemon.py serve", file=sys.stderr)
+        return 2
+    except (RuntimeError, ConnectionError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"\nPipeline completed with {'success' if results['review_passed'] else 'warnings'} (run {results['run_id']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
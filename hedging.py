@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+from tracing import instant
+
+
+class Hedger:
+    """Hedged agent calls to cut tail latency.
+
+    A call that has not answered after the given percentile of recent latency
+    for its agent gets a duplicate request; whichever answers first wins.
+    Duplicates are limited by a spend budget in (estimated) prompt tokens.
+
+    The pipeline does not stream, so the trigger is the full response time
+    rather than time to first token. A losing request cannot be aborted
+    mid-flight by the underlying client: it is cancelled if it has not
+    started yet and otherwise left to finish in the background with its
+    reply discarded.
+    """
+
+    def __init__(self, percentile: float = 0.9, min_samples: int = 5, initial_delay: float = 30.0,
+                 spend_budget: int = 50000, window: int = 50, max_workers: int = 8):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.spend_budget = spend_budget
+        self.spent = 0
+        self.stats = {"calls": 0, "hedged": 0, "backup_wins": 0, "over_budget": 0}
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def record(self, agent_name: str, seconds: float):
+        """Add an observed latency for an agent."""
+        with self._lock:
+            self._latencies[agent_name].append(seconds)
+
+    def delay_for(self, agent_name: str) -> float:
+        """Seconds to wait before hedging a call to this agent."""
+        with self._lock:
+            samples = sorted(self._latencies[agent_name])
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        index = min(len(samples) - 1, int(round(self.percentile * (len(samples) - 1))))
+        return samples[index]
+
+    def _reserve(self, cost: int) -> bool:
+        with self._lock:
+            if self.spent + cost > self.spend_budget:
+                self.stats["over_budget"] += 1
+                return False
+            self.spent += cost
+            self.stats["hedged"] += 1
+            return True
+
+    def call(self, agent_name: str, primary: Callable[[], str], backup: Callable[[], str],
+             cost: int = 0, delay: Optional[float] = None) -> str:
+        """Run primary, hedging with backup if it is slow; return the first reply."""
+        with self._lock:
+            self.stats["calls"] += 1
+        delay = self.delay_for(agent_name) if delay is None else delay
+        start = time.monotonic()
+
+        first = self._executor.submit(primary)
+        done, _ = wait([first], timeout=delay)
+        if done or not self._reserve(cost):
+            result = first.result()
+            self.record(agent_name, time.monotonic() - start)
+            return result
+
+        instant("hedge", cat="agent", agent=agent_name, delay_s=round(delay, 3))
+        second = self._executor.submit(backup)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if future is second:
+                    with self._lock:
+                        self.stats["backup_wins"] += 1
+                instant("hedge won by " + ("backup" if future is second else "primary"), cat="agent", agent=agent_name)
+                self.record(agent_name, time.monotonic() - start)
+                return future.result()
+        raise error
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
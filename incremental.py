@@ -0,0 +1,296 @@
+import ast
+import copy
+import difflib
+import json
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from project_layout import is_project_bundle, join_project, split_project
+from test_runner import collect_test_ids
+
+SPEC_DELTA_INSTRUCTIONS = """
+            Return only a JSON array of operations, in a single ```json block, that turn the CURRENT
+            SPECIFICATION into one reflecting the edited requirements:
+            [{"op": "add" | "replace" | "remove", "path": "/functional_requirements/2", "value": ...}]
+            Paths are JSON pointers into the current specification: "add" inserts at a list index (or "/-"
+            to append) or creates a key, "replace" overwrites, "remove" deletes ("value" is omitted).
+            Change only what the edit affects; return [] if the specification is unaffected.
+            """
+
+PATCH_INSTRUCTIONS = """
+            Return ONLY what changes, in a single ```python block: each top-level function, class or constant
+            you add or modify, complete, plus any new imports. Do not repeat unchanged definitions. To delete
+            a top-level definition, write a line `# remove: <name>`.
+            """
+
+PROJECT_PATCH_INSTRUCTIONS = """
+            The code is a multi-file package: start the changes to each file with its
+            '# === File: <path> ===' line and leave out files that do not change.
+            """
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+_REMOVE = re.compile(r"^#\s*remove:\s*([A-Za-z_]\w*)\s*$", re.M)
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def requirement_changes(old: str, new: str) -> str:
+    """Sentences removed from and added to a requirement, as -/+ lines (empty if unchanged)."""
+    old_sentences = [s.strip() for s in _SENTENCE.split(old) if s.strip()]
+    new_sentences = [s.strip() for s in _SENTENCE.split(new) if s.strip()]
+    lines = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(a=old_sentences, b=new_sentences).get_opcodes():
+        if tag != "equal":
+            lines += [f"- {sentence}" for sentence in old_sentences[i1:i2]]
+            lines += [f"+ {sentence}" for sentence in new_sentences[j1:j2]]
+    return "\n".join(lines)
+
+
+def _json_block(text: str):
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.S)
+    return json.loads(fenced.group(1) if fenced else text.strip())
+
+
+def parse_spec(structured_req: str) -> Optional[Dict]:
+    """The structured specification as JSON, or None if the analyst did not produce JSON."""
+    try:
+        spec = _json_block(structured_req)
+    except ValueError:
+        return None
+    return spec if isinstance(spec, dict) else None
+
+
+def parse_spec_delta(content: str) -> Optional[List[Dict]]:
+    """Operations from the analyst's reply, or None if it is not a list of operations."""
+    try:
+        ops = _json_block(content)
+    except ValueError:
+        return None
+    if isinstance(ops, dict):
+        ops = ops.get("operations", ops.get("changes"))
+    if not isinstance(ops, list) or not all(isinstance(op, dict) and "op" in op and "path" in op for op in ops):
+        return None
+    return ops
+
+
+def apply_spec_delta(spec: Dict, ops: List[Dict]) -> Dict:
+    """Apply add/replace/remove operations (a JSON Patch subset); raises ValueError on a bad path."""
+    spec = copy.deepcopy(spec)
+    for op in ops:
+        keys = [key.replace("~1", "/").replace("~0", "~") for key in str(op["path"]).lstrip("/").split("/")]
+        parent = spec
+        try:
+            for key in keys[:-1]:
+                parent = parent[int(key)] if isinstance(parent, list) else parent[key]
+            last = keys[-1]
+            if isinstance(parent, list):
+                index = len(parent) if last == "-" else int(last)
+                if op["op"] == "add":
+                    parent.insert(index, op.get("value"))
+                elif op["op"] == "replace":
+                    parent[index] = op.get("value")
+                elif op["op"] == "remove":
+                    del parent[index]
+                else:
+                    raise ValueError(f"unknown operation {op['op']!r}")
+            elif op["op"] in ("add", "replace"):
+                parent[last] = op.get("value")
+            elif op["op"] == "remove":
+                del parent[last]
+            else:
+                raise ValueError(f"unknown operation {op['op']!r}")
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError(f"cannot apply {op['op']} at {op['path']}: {e!r}") from e
+    return spec
+
+
+def _node_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, _DEFINITIONS):
+        return node.name
+    if isinstance(node, (ast.Assign, ast.AnnAssign)):
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        if len(targets) == 1 and isinstance(targets[0], ast.Name):
+            return targets[0].id
+    if isinstance(node, ast.If) and "__name__" in ast.unparse(node.test):
+        return "__main__"
+    return None
+
+
+def _span(node: ast.AST) -> Tuple[int, int]:
+    start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+    return start, node.end_lineno
+
+
+def _merge_file(code: str, patch: str) -> Tuple[str, Set[str], Set[str]]:
+    """Replace or add the patch's top-level definitions in one file; apply its `# remove:` lines."""
+    tree, patch_tree = ast.parse(code), ast.parse(patch)
+    lines, patch_lines = code.splitlines(), patch.splitlines()
+    existing = {_node_name(node): node for node in tree.body if _node_name(node)}
+    known_imports = {ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))}
+
+    edits: List[Tuple[int, int, List[str]]] = []  # (start, end, replacement lines), 1-based inclusive
+    changed, removed, appended, imports = set(), set(), [], []
+    for node in patch_tree.body:
+        start, end = _span(node)
+        source = patch_lines[start - 1:end]
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if ast.unparse(node) not in known_imports:
+                imports += source
+            continue
+        name = _node_name(node)
+        if name is None:
+            continue
+        changed.add(name)
+        if name in existing:
+            edits.append((*_span(existing[name]), source))
+        else:
+            appended.append(source)
+    for name in _REMOVE.findall(patch):
+        if name in existing and name not in changed:
+            edits.append((*_span(existing[name]), []))
+            removed.add(name)
+
+    for start, end, replacement in sorted(edits, reverse=True):
+        lines[start - 1:end] = replacement
+    # New definitions go before the main block (if any), new imports after the last import
+    main_block = next((node for node in ast.parse("\n".join(lines)).body if _node_name(node) == "__main__"), None)
+    insert_at = _span(main_block)[0] - 1 if main_block is not None else len(lines)
+    for source in reversed(appended):
+        lines[insert_at:insert_at] = ["", ""] + source + (["", ""] if insert_at < len(lines) else [])
+    if imports:
+        import_nodes = [node for node in ast.parse("\n".join(lines)).body if isinstance(node, (ast.Import, ast.ImportFrom))]
+        at = import_nodes[-1].end_lineno if import_nodes else 0
+        lines[at:at] = imports
+    return re.sub(r"\n{4,}", "\n\n\n", "\n".join(lines)).strip() + "\n", changed, removed
+
+
+def merge_patch(code: str, patch: str) -> Tuple[str, Set[str], Set[str]]:
+    """Apply a patch of top-level definitions to code (a file or a project bundle).
+
+    Returns the merged code and the names changed (replaced or added) and
+    removed; names in a bundle are prefixed with their file path. Raises
+    SyntaxError if the code or the patch does not parse.
+    """
+    if not is_project_bundle(code):
+        if is_project_bundle(patch):
+            patch = "\n".join(split_project(patch).values())
+        return _merge_file(code, patch)
+    files = split_project(code)
+    patches = split_project(patch) if is_project_bundle(patch) else {next(iter(files)): patch}
+    changed, removed = set(), set()
+    for path, file_patch in patches.items():
+        if path in files:
+            files[path], file_changed, file_removed = _merge_file(files[path], file_patch)
+        else:
+            files[path], file_changed, file_removed = file_patch.strip() + "\n", {
+                _node_name(node) for node in ast.parse(file_patch).body if _node_name(node)}, set()
+        changed |= {f"{path}:{name}" for name in file_changed}
+        removed |= {f"{path}:{name}" for name in file_removed}
+    return join_project(files), changed, removed
+
+
+def interface(code: str) -> Dict[str, str]:
+    """Public signature of each top-level definition (class methods included), keyed like merge_patch names."""
+    files = split_project(code) if is_project_bundle(code) else {"": code}
+    signatures = {}
+    for path, source in files.items():
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            continue
+        prefix = f"{path}:" if path else ""
+        for node in tree.body:
+            name = _node_name(node)
+            if name is None or name == "__main__":
+                continue
+            if isinstance(node, ast.ClassDef):
+                methods = [f"def {item.name}({ast.unparse(item.args)})" for item in node.body
+                           if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))
+                           and (not item.name.startswith("_") or item.name == "__init__")]
+                signatures[prefix + name] = f"class {name}: " + "; ".join(methods)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+                signatures[prefix + name] = f"def {name}({ast.unparse(node.args)}){returns}"
+            else:
+                signatures[prefix + name] = f"{name} = ..."
+    return signatures
+
+
+def interface_changes(old_code: str, new_code: str) -> Set[str]:
+    """Names whose public signature was added, removed or changed."""
+    old, new = interface(old_code), interface(new_code)
+    return {name for name in old.keys() | new.keys() if old.get(name) != new.get(name)}
+
+
+def bare_names(names: Set[str]) -> Set[str]:
+    """Names without their bundle file prefix, as other modules refer to them."""
+    return {name.rsplit(":", 1)[-1] for name in names}
+
+
+def names_used(source: str) -> Set[str]:
+    """Every identifier and attribute name a module refers to."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set()
+    used = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            used.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            used.add(node.attr)
+        elif isinstance(node, ast.alias):
+            used.add(node.name.rsplit(".", 1)[-1])
+    return used
+
+
+def _is_fixture(node: ast.AST) -> bool:
+    return any("fixture" in ast.unparse(decorator.func if isinstance(decorator, ast.Call) else decorator)
+               for decorator in getattr(node, "decorator_list", []))
+
+
+def _usefixtures(decorators: List[ast.expr]) -> Set[str]:
+    """Fixture names applied with @pytest.mark.usefixtures(...)."""
+    return {arg.value for decorator in decorators
+            if isinstance(decorator, ast.Call) and "usefixtures" in ast.unparse(decorator.func)
+            for arg in decorator.args if isinstance(arg, ast.Constant)}
+
+
+def _requested(node: ast.AST) -> Set[str]:
+    """Fixtures a test or fixture requests: its parameters and usefixtures marks."""
+    args = node.args
+    return {arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs} | _usefixtures(node.decorator_list)
+
+
+def tests_touching(tests: str, names: Set[str], filename: str = "test_main.py") -> List[str]:
+    """Node ids of the test functions and methods that refer to any of the names.
+
+    A test also refers to them through the fixtures it requests, directly or
+    via other fixtures.
+    """
+    try:
+        tree = ast.parse(tests)
+    except SyntaxError:
+        return []
+    functions = [(None, node) for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            functions += [(node, item) for item in node.body if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    fixtures = [function for _, function in functions if _is_fixture(function)]
+
+    # Fixtures using the names, then fixtures requesting those, until nothing changes
+    touching_fixtures: Set[str] = set()
+    while True:
+        found = {fixture.name for fixture in fixtures if fixture.name not in touching_fixtures
+                 and (names_used(ast.unparse(fixture)) & names or _requested(fixture) & touching_fixtures)}
+        if not found:
+            break
+        touching_fixtures |= found
+
+    touching = set()
+    for cls, function in functions:
+        if _is_fixture(function):
+            continue
+        requested = _requested(function) | (_usefixtures(cls.decorator_list) if cls is not None else set())
+        if names_used(ast.unparse(function)) & names or requested & touching_fixtures:
+            touching.add(f"{filename}::{cls.name}::{function.name}" if cls else f"{filename}::{function.name}")
+    return [test_id for test_id in collect_test_ids(tests, filename) if test_id in touching]
@@ -0,0 +1,379 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+from cassette import request_key
+
+# Durable job queue shared by every worker process (and host) using the same file
+JOB_QUEUE = os.getenv("JOB_QUEUE", "output/jobs.db")
+# WAL needs shared memory, so turn it off when workers on several hosts share the file
+JOB_QUEUE_WAL = os.getenv("JOB_QUEUE_WAL", "1") == "1"
+
+DEFAULT_LEASE_SECONDS = 120.0
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    requirement TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    last_error TEXT,
+    run_id TEXT,
+    results TEXT,
+    tenant TEXT NOT NULL DEFAULT 'batch'
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_leases ON jobs (status, lease_expires_at);
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    job_id TEXT NOT NULL REFERENCES jobs (id),
+    seq INTEGER NOT NULL,
+    agent TEXT NOT NULL,
+    key TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+# Parts of feedback prompts that differ between attempts of the same job: sandbox paths, object addresses
+# and timings in test output (format_failures), latency measurements (format_violations)
+_RUN_VARIABLE = [
+    (re.compile(r"\S*agent_tests_\w+"), "<workspace>"),
+    (re.compile(r"\b0x[0-9a-fA-F]{6,}\b"), "<address>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\s*(?:ms|s|sec|seconds)\b"), "<duration>"),
+    (re.compile(r"\bover \d+ runs\b"), "over <n> runs"),
+]
+
+
+def checkpoint_key(agent_name: str, message: str) -> str:
+    """Request key with run-variable parts masked, so a reclaimed job's re-run feedback still matches."""
+    for pattern, replacement in _RUN_VARIABLE:
+        message = pattern.sub(replacement, message)
+    return request_key(agent_name, message)
+
+
+# Job states: queued -> running -> done, or back to queued for a retry, or dead after max_attempts
+QUEUED, RUNNING, DONE, DEAD = "queued", "running", "done", "dead"
+
+
+class JobQueue:
+    """Durable job queue in a SQLite file, with leases, heartbeats, retries and dead-lettering.
+
+    A worker claims a job by taking a lease on it and keeps the lease alive
+    with heartbeats. If the worker dies, the lease expires and another
+    worker claims the job again. Failed jobs are retried with exponential
+    backoff; after max_attempts they are dead-lettered for inspection.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # Queues created before jobs had a tenant
+            if "tenant" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN tenant TEXT NOT NULL DEFAULT 'batch'")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if JOB_QUEUE_WAL:
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def submit(self, requirement: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS, tenant: str = "batch") -> str:
+        job_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, requirement, status, max_attempts, created_at, available_at, tenant) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", (job_id, requirement, QUEUED, max_attempts, now, now, tenant))
+        return job_id
+
+    def claim(self, owner: str) -> Optional[sqlite3.Row]:
+        """Lease the oldest ready job (or one whose worker stopped heartbeating)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases that used up their attempts are dead-lettered, not retried again
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, lease_owner = NULL, "
+                    "last_error = COALESCE(last_error, 'lease expired') "
+                    "WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts",
+                    (DEAD, now, RUNNING, now),
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE (status = ? AND available_at <= ?) "
+                    "OR (status = ? AND lease_expires_at < ?) ORDER BY created_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, "
+                    "lease_expires_at = ?, heartbeat_at = ? WHERE id = ?",
+                    (RUNNING, owner, now + self.lease_seconds, now, row["id"]),
+                )
+                job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                conn.execute("COMMIT")
+                return job
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """Extend a lease; False if the lease was lost to another worker."""
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?, heartbeat_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                (now + self.lease_seconds, now, job_id, owner, RUNNING),
+            ).rowcount
+        return updated == 1
+
+    def complete(self, job_id: str, owner: str, results: Dict) -> bool:
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, lease_owner = NULL, run_id = ?, results = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = ?",
+                (DONE, time.time(), results.get("run_id"), json.dumps(results, default=str), job_id, owner, RUNNING),
+            ).rowcount
+        return updated == 1
+
+    def fail(self, job_id: str, owner: str, error: str) -> Optional[str]:
+        """Requeue a failed job with backoff, or dead-letter it; returns the new status."""
+        now = time.time()
+        with self._connect() as conn:
+            job = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = ?",
+                               (job_id, owner, RUNNING)).fetchone()
+            if job is None:
+                return None
+            if job["attempts"] >= job["max_attempts"]:
+                status, available_at = DEAD, now
+            else:
+                status, available_at = QUEUED, now + RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+            # The lease may have expired and been reclaimed since the SELECT
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, last_error = ?, "
+                "finished_at = CASE WHEN ? = 'dead' THEN ? END WHERE id = ? AND lease_owner = ? AND status = ?",
+                (status, available_at, error, status, now, job_id, owner, RUNNING),
+            ).rowcount
+        return status if updated == 1 else None
+
+    def retry(self, job_id: str) -> bool:
+        """Put a dead-lettered job back in the queue with fresh attempts."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, finished_at = NULL WHERE id = ? AND status = ?",
+                (QUEUED, time.time(), job_id, DEAD),
+            ).rowcount == 1
+
+    def get(self, job_id: str) -> Optional[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return {row["status"]: row["n"] for row in
+                    conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+
+    def jobs(self, status: Optional[str] = None, limit: int = 20) -> List[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT id, status, attempts, max_attempts, created_at, lease_owner, last_error, run_id, "
+                "substr(requirement, 1, 60) AS requirement FROM jobs WHERE ? IS NULL OR status = ? "
+                "ORDER BY created_at DESC LIMIT ?", (status, status, limit),
+            ).fetchall()
+
+
+class JobCheckpoints:
+    """Completed agent calls of one job, stored in the queue database.
+
+    Every agent reply is saved as soon as it arrives. When a job is picked
+    up again after a crash, calls with the same agent and prompt (ignoring
+    timings and sandbox paths in test and benchmark feedback) are served
+    from here, so finished stages are replayed without calling the model
+    and the pipeline continues where the previous attempt stopped.
+    """
+
+    def __init__(self, queue: JobQueue, job_id: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._saved: Dict[str, deque] = defaultdict(deque)
+        with queue._connect() as conn:
+            rows = conn.execute("SELECT key, response, seq FROM checkpoints WHERE job_id = ? ORDER BY seq",
+                                (job_id,)).fetchall()
+        for row in rows:
+            self._saved[row["key"]].append(row["response"])
+        self._next_seq = rows[-1]["seq"] + 1 if rows else 0
+
+    def lookup(self, agent_name: str, message: str) -> Optional[str]:
+        with self._lock:
+            saved = self._saved.get(checkpoint_key(agent_name, message))
+            if not saved:
+                return None
+            self.reused += 1
+            return saved.popleft()
+
+    def save(self, agent_name: str, message: str, response: str):
+        with self._lock:
+            seq, self._next_seq = self._next_seq, self._next_seq + 1
+        with self.queue._connect() as conn:
+            conn.execute("INSERT INTO checkpoints (job_id, seq, agent, key, response, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         (self.job_id, seq, agent_name, checkpoint_key(agent_name, message), response, time.time()))
+
+
+def _heartbeat_until(queue: JobQueue, job_id: str, owner: str, stop: threading.Event):
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.heartbeat(job_id, owner):
+            print(f"[Worker {owner}] lost the lease on job {job_id}", file=sys.stderr)
+            return
+
+
+def work(path: str = JOB_QUEUE, lease_seconds: float = DEFAULT_LEASE_SECONDS, poll_seconds: float = 2.0,
+         max_jobs: Optional[int] = None) -> int:
+    """Process jobs until interrupted (or max_jobs are done); returns the number processed."""
+    from main import Colors, MultiAgentCodingSystem, print_step
+    from scheduler import BATCH
+
+    queue = JobQueue(path, lease_seconds)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    system = None
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = queue.claim(owner)
+        if job is None:
+            time.sleep(poll_seconds)
+            continue
+        print_step("Worker", f"{owner} running job {job['id']} (attempt {job['attempts']}/{job['max_attempts']})")
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat_until, args=(queue, job["id"], owner, stop), daemon=True).start()
+        try:
+            if system is None:
+                # Built once per worker process and reused for every job; queued jobs are batch work
+                system = MultiAgentCodingSystem(priority=BATCH)
+            system.tenant = job["tenant"]
+            system.checkpoints = JobCheckpoints(queue, job["id"])
+            results = system.run_full_pipeline(job["requirement"])
+        except Exception:
+            status = queue.fail(job["id"], owner, traceback.format_exc())
+            print_step("Worker", f"{Colors.FAIL}Job {job['id']} failed{Colors.ENDC} ({status or 'lease lost'})")
+        else:
+            if not queue.complete(job["id"], owner, results):
+                print_step("Worker", f"{Colors.WARNING}Job {job['id']} finished after its lease was lost{Colors.ENDC}")
+            else:
+                print_step("Worker", f"{Colors.GREEN}Job {job['id']} done{Colors.ENDC} "
+                                     f"(run {results['run_id']}, {system.checkpoints.reused} call(s) reused)")
+        finally:
+            stop.set()
+            if system is not None:
+                system.checkpoints = None
+                # The ledger already has this run's calls; keep a reused system from growing
+                system.call_log.clear()
+        processed += 1
+    return processed
+
+
+def _worker_process(path: str, lease_seconds: float):
+    try:
+        work(path, lease_seconds)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Durable job queue for pipeline runs.")
+    parser.add_argument("--db", default=JOB_QUEUE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="queue requirements read from stdin (or --file)")
+    submit.add_argument("--file", action="append", help="one job per file; may be repeated")
+    submit.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    submit.add_argument("--tenant", default="batch", help="tenant whose fair share of LLM slots the jobs use")
+
+    worker = commands.add_parser("worker", help="run jobs from the queue")
+    worker.add_argument("--processes", type=int, default=1, help="worker processes, e.g. one per core")
+    worker.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS, help="lease length in seconds")
+
+    commands.add_parser("status", help="job counts by status")
+    listing = commands.add_parser("list", help="recent jobs")
+    listing.add_argument("--status", choices=[QUEUED, RUNNING, DONE, DEAD])
+    listing.add_argument("--limit", type=int, default=20)
+    show = commands.add_parser("show", help="one job, with its results or last error")
+    show.add_argument("job_id")
+    retry = commands.add_parser("retry", help="requeue a dead-lettered job")
+    retry.add_argument("job_id")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        if args.processes <= 1:
+            _worker_process(args.db, args.lease)
+            return 0
+        JobQueue(args.db)  # create the schema once, before the workers race for it
+        processes = [multiprocessing.Process(target=_worker_process, args=(args.db, args.lease), daemon=False)
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()
+        return 0
+
+    queue = JobQueue(args.db)
+    if args.command == "submit":
+        requirements = [open(path).read() for path in args.file] if args.file else [sys.stdin.read()]
+        for requirement in requirements:
+            print(queue.submit(requirement, args.max_attempts, args.tenant))
+    elif args.command == "status":
+        print(json.dumps(queue.counts()))
+    elif args.command == "list":
+        for row in queue.jobs(args.status, args.limit):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["created_at"]))
+            print(f"{row['id']}  {when}  {row['status']:<8} attempts={row['attempts']}/{row['max_attempts']}  "
+                  f"{row['lease_owner'] or ''}  {row['requirement']}")
+    elif args.command == "show":
+        job = queue.get(args.job_id)
+        if job is None:
+            print(f"No job {args.job_id}", file=sys.stderr)
+            return 1
+        print(json.dumps({key: job[key] for key in job.keys() if key != "results"}, indent=2))
+        if job["results"]:
+            print(job["results"])
+    else:
+        if not queue.retry(args.job_id):
+            print(f"Job {args.job_id} is not dead-lettered", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from mock_llm import MockLLMServer
+
+# Saved load-test reports, for comparing versions
+LOADTEST_DIR = os.getenv("LOADTEST_DIR", "output/loadtest")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_REQUIREMENT = "Create a calculator module that can add and subtract two numbers, with clear error messages."
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(pct * len(values)))]
+
+
+def _rss_mb(pid: int) -> float:
+    """Resident memory of a process in MB (Linux /proc; 0 elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class MemorySampler:
+    """Samples a process's resident memory in the background and keeps the peak."""
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="memory-sampler", daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, _rss_mb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "MemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def cli_session(requirement: str, env: Dict[str, str], timeout: float) -> Dict:
+    """One CLI user: `python main.py --cli` as a subprocess, measured with wait4 (Unix)."""
+    start = time.monotonic()
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen([sys.executable, "main.py", "--cli"], cwd=REPO_DIR, env=env,
+                                   stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            process.stdin.write(requirement.encode())
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        finally:
+            timer.cancel()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stderr.seek(0)
+        error_output = stderr.read().decode(errors="replace")
+    ok = process.returncode == 0
+    return {
+        "ok": ok,
+        "latency": time.monotonic() - start,
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        "max_rss_mb": usage.ru_maxrss / 1024,
+        "error": None if ok else (error_output.strip().splitlines() or [f"exit code {process.returncode}"])[-1],
+    }
+
+
+def app_session(requirement: str, timeout: float) -> Dict:
+    """One Streamlit user: a headless session of app.py (streamlit.testing) that submits and waits for results."""
+    from streamlit.testing.v1 import AppTest
+
+    start = time.monotonic()
+    try:
+        app = AppTest.from_file(os.path.join(REPO_DIR, "app.py"), default_timeout=timeout)
+        app.run()
+        app.text_area[0].input(requirement)
+        app.button[0].click()
+        app.run()
+    except Exception as e:
+        return {"ok": False, "latency": time.monotonic() - start, "error": repr(e)}
+    ok = any("Solution generated" in str(element.value) for element in app.success)
+    error = None
+    if not ok:
+        messages = [str(element.value) for element in list(app.exception) + list(app.error)]
+        error = messages[0].splitlines()[0] if messages else "no results rendered"
+    return {"ok": ok, "latency": time.monotonic() - start, "error": error}
+
+
+def run_level(target: str, sessions: int, per_session: int, requirement: str, env: Dict[str, str],
+              timeout: float) -> Dict:
+    """Run `sessions` concurrent users, each submitting `per_session` requirements in turn."""
+    def user(_):
+        if target == "cli":
+            return [cli_session(requirement, env, timeout) for _ in range(per_session)]
+        return [app_session(requirement, timeout) for _ in range(per_session)]
+
+    before_self = resource.getrusage(resource.RUSAGE_SELF)
+    before_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.monotonic()
+    with MemorySampler(os.getpid()) as sampler, ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = [result for batch in executor.map(user, range(sessions)) for result in batch]
+    wall = time.monotonic() - start
+    after_self = resource.getrusage(resource.RUSAGE_SELF)
+    after_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    latencies = [result["latency"] for result in results if result["ok"]]
+    errors = [result["error"] for result in results if not result["ok"]]
+    # In app mode this process is the server; in CLI mode every user is its own process
+    cpu_seconds = sum(after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime
+                      for before, after in ((before_self, after_self), (before_children, after_children)))
+    report = {
+        "sessions": sessions,
+        "requests": len(results),
+        "completed": len(latencies),
+        "error_rate": len(errors) / len(results) if results else 0.0,
+        "throughput_per_min": len(latencies) / wall * 60 if wall else 0.0,
+        "wall_seconds": wall,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": max(latencies) if latencies else None,
+        "cpu_seconds": cpu_seconds,
+        "cpu_utilisation": cpu_seconds / wall / (os.cpu_count() or 1) if wall else 0.0,
+        "errors": sorted(set(errors))[:5],
+    }
+    if target == "app":
+        report["server_peak_rss_mb"] = sampler.peak_mb
+    else:
+        report["process_peak_rss_mb"] = max((result["max_rss_mb"] for result in results), default=0.0)
+    return report
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _format_level(level: Dict) -> str:
+    fmt = lambda value: "-" if value is None else f"{value:.1f}"
+    memory = level.get("server_peak_rss_mb", level.get("process_peak_rss_mb", 0.0))
+    return (f"{level['sessions']:>8}{level['completed']:>6}/{level['requests']:<5}{level['throughput_per_min']:>10.2f}"
+            f"{fmt(level['latency_p50']):>9}{fmt(level['latency_p95']):>9}{fmt(level['latency_p99']):>9}"
+            f"{level['error_rate']:>8.0%}{level['cpu_utilisation']:>7.0%}{memory:>9.0f}")
+
+
+HEADER = f"{'sessions':>8}{'done':>11}{'runs/min':>10}{'p50 (s)':>9}{'p95 (s)':>9}{'p99 (s)':>9}{'errors':>8}{'cpu':>7}{'rss MB':>9}"
+
+
+def load_test(target: str, ramp: List[int], per_session: int = 1, requirement: str = DEFAULT_REQUIREMENT,
+              latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0, timeout: float = 600.0,
+              max_error_rate: float = 0.5, app_workers: Optional[int] = None) -> Dict:
+    """Ramp concurrent sessions against a mock LLM and return the report."""
+    server = MockLLMServer(latency=latency, jitter=jitter, error_rate=error_rate, seed=0).start()
+    env = dict(os.environ, LLM_BASE_URL=server.base_url, GROQ_API_KEY="mock", OPENAI_API_KEY="",
+               LLM_CACHE_SEED="", CASSETTE="")
+    if target == "app":
+        # The app runs in this process: configure it before it is first imported
+        os.environ.update(env)
+        if app_workers:
+            os.environ["RUN_WORKERS"] = str(app_workers)
+
+    report = {
+        "target": target,
+        "revision": _git_revision(),
+        "started_at": time.time(),
+        "config": {"ramp": ramp, "per_session": per_session, "requirement": requirement, "llm_latency": latency,
+                   "llm_jitter": jitter, "llm_error_rate": error_rate, "app_workers": app_workers,
+                   "cpu_count": os.cpu_count()},
+        "levels": [],
+    }
+    print(HEADER)
+    try:
+        for sessions in ramp:
+            level = run_level(target, sessions, per_session, requirement, env, timeout)
+            report["levels"].append(level)
+            print(_format_level(level), flush=True)
+            if level["error_rate"] > max_error_rate:
+                print(f"Stopping the ramp: error rate {level['error_rate']:.0%} at {sessions} sessions")
+                break
+    finally:
+        server.shutdown()
+    report["mock_llm"] = server.stats
+    best = max(report["levels"], key=lambda level: level["throughput_per_min"], default=None)
+    if best:
+        report["peak_throughput"] = {"sessions": best["sessions"], "throughput_per_min": best["throughput_per_min"]}
+    return report
+
+
+def save_report(report: Dict, directory: str = LOADTEST_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(report["started_at"]))
+    path = os.path.join(directory, f"{stamp}-{report['target']}-{report['revision'] or 'unknown'}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def compare(old_path: str, new_path: str):
+    """Print throughput and p95 latency per load level of two saved reports."""
+    with open(old_path) as f:
+        old = {level["sessions"]: level for level in json.load(f)["levels"]}
+    with open(new_path) as f:
+        new = {level["sessions"]: level for level in json.load(f)["levels"]}
+    change = lambda a, b: "-" if not a or b is None else f"{(b - a) / a:+.0%}"
+    print(f"{'sessions':>8}{'runs/min old':>14}{'new':>8}{'change':>8}{'p95 old':>10}{'new':>8}{'change':>8}")
+    for sessions in sorted(set(old) & set(new)):
+        a, b = old[sessions], new[sessions]
+        p95 = lambda level: "-" if level["latency_p95"] is None else f"{level['latency_p95']:.1f}"
+        print(f"{sessions:>8}{a['throughput_per_min']:>14.2f}{b['throughput_per_min']:>8.2f}"
+              f"{change(a['throughput_per_min'], b['throughput_per_min']):>8}"
+              f"{p95(a):>10}{p95(b):>8}{change(a['latency_p95'], b['latency_p95']):>8}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the pipeline front-ends against a mock LLM.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="ramp concurrent sessions and report capacity")
+    run.add_argument("--target", choices=["app", "cli"], default="app",
+                     help="app: headless sessions of one app.py server (this process); cli: one main.py --cli per user")
+    run.add_argument("--ramp", default="1,2,4,8", help="comma-separated concurrent session counts")
+    run.add_argument("--per-session", type=int, default=1, help="requirements each session submits in turn")
+    run.add_argument("--requirement", default=DEFAULT_REQUIREMENT)
+    run.add_argument("--llm-latency", type=float, default=0.5, help="mean mock LLM seconds per call")
+    run.add_argument("--llm-jitter", type=float, default=0.2)
+    run.add_argument("--llm-error-rate", type=float, default=0.0)
+    run.add_argument("--app-workers", type=int, help="RUN_WORKERS of the app's shared worker pool")
+    run.add_argument("--timeout", type=float, default=600.0, help="seconds per request")
+    run.add_argument("--max-error-rate", type=float, default=0.5, help="stop ramping above this error rate")
+    cmp_parser = commands.add_parser("compare", help="compare two saved reports")
+    cmp_parser.add_argument("old")
+    cmp_parser.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        compare(args.old, args.new)
+        return 0
+    report = load_test(args.target, [int(n) for n in args.ramp.split(",")], args.per_session, args.requirement,
+                       args.llm_latency, args.llm_jitter, args.llm_error_rate, args.timeout, args.max_error_rate,
+                       args.app_workers)
+    print(f"Report saved to {save_report(report)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from cache_admin import AGENT_SIGNATURES
+from context_budget import estimate_tokens
+
+# Canned replies per agent: just enough for every pipeline stage to succeed
+RESPONSES = {
+    "RequirementAnalyst": """```json
+{"functional_requirements": ["Add two numbers", "Subtract two numbers"],
+ "non_functional_requirements": ["Clear error messages for invalid input"],
+ "technical_requirements": ["Python 3", "No external dependencies"]}
+```""",
+    "CodeDeveloper": '''```python
+def add(a: float, b: float) -> float:
+    """Return the sum of a and b."""
+    return a + b
+
+
+def subtract(a: float, b: float) -> float:
+    """Return a minus b."""
+    return a - b
+```''',
+    "CodeReviewer": """The code is correct, readable and meets the requirements.
+```json
+{"verdict": "PASS", "issues": [{"severity": "info", "location": "add", "description": "Consider input validation"}]}
+```""",
+    "DocumentationSpecialist": "# Calculator\n\n`add(a, b)` returns the sum, `subtract(a, b)` the difference.\n",
+    "TestEngineer": '''```python
+from main import add, subtract
+
+
+def test_add():
+    assert add(2, 3) == 5
+
+
+def test_subtract():
+    assert subtract(5, 3) == 2
+```''',
+    "StreamlitUIDesigner": '''```python
+import streamlit as st
+from main import add
+
+a = st.number_input("a")
+b = st.number_input("b")
+st.write(add(a, b))
+```''',
+}
+
+
+def agent_for_messages(messages) -> str:
+    """Name of the agent a chat request comes from, by its system message."""
+    for message in messages:
+        if message.get("role") == "system":
+            first_line = (message.get("content") or "").strip().splitlines()[:1]
+            if first_line:
+                return AGENT_SIGNATURES.get(first_line[0].strip(), "unknown")
+    return "unknown"
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """Local OpenAI-compatible chat completions endpoint with simulated latency and errors.
+
+    Point the pipeline at it with LLM_BASE_URL=http://127.0.0.1:<port>/v1.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "MockLLMServer":
+        threading.Thread(target=self.serve_forever, name="mock-llm", daemon=True).start()
+        return self
+
+    def _draw(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.stats["errors"] += 1
+            delay = max(0.0, self.random.gauss(self.latency, self.jitter))
+        return fail, delay
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: Dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._reply(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        server: MockLLMServer = self.server
+        fail, delay = server._draw()
+        time.sleep(delay)
+        if fail:
+            self._reply(500, {"error": {"message": "simulated server error", "type": "server_error"}})
+            return
+        content = RESPONSES.get(agent_for_messages(request.get("messages", [])), "OK")
+        prompt_tokens = sum(estimate_tokens(str(message.get("content") or "")) for message in request.get("messages", []))
+        completion_tokens = estimate_tokens(content)
+        self._reply(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM endpoint.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="standard deviation in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 500")
+    args = parser.parse_args(argv)
+    server = MockLLMServer(args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Mock LLM listening: LLM_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
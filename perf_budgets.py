@@ -0,0 +1,187 @@
+import json
+import re
+import shutil
+from dataclasses import dataclass
+from typing import Dict, List
+
+from incremental import parse_spec
+from review_loop import ReviewIssue
+from test_runner import DEFAULT_MEMORY_MB, prepare_workspace, run_sandboxed
+from tracing import span
+
+# A latency target such as "within 100ms", "under 2 seconds" or "< 50 ms"
+_LATENCY = re.compile(
+    r"(?:within|under|below|less than|no more than|not exceed(?:ing)?|at most|max(?:imum)?(?: of)?|<=?|≤)\s*"
+    r"(?:a |an )?(\d+(?:\.\d+)?)\s*(ms|milliseconds?|msecs?|s|secs?|seconds?|us|µs|microseconds?)\b",
+    re.I,
+)
+
+
+def _unit_ms(unit: str) -> float:
+    unit = unit.lower()
+    if unit.startswith(("ms", "milli")):
+        return 1.0
+    if unit in ("us", "µs") or unit.startswith("micro"):
+        return 0.001
+    return 1000.0
+
+
+# Module the generated benchmarks are saved as, next to the code
+BENCH_MODULE = "bench_main.py"
+
+BENCHMARK_INSTRUCTIONS = """
+            Write a Python module that benchmarks the code against each budget below. It must define
+            BENCHMARKS = {"<budget id>": <zero-argument callable>, ...} with one entry per budget id.
+            Each callable performs exactly ONE of the operations its budget constrains (e.g. one
+            calculation, one request handler call). Do all setup (imports, objects, test data) at module
+            level, not inside the callables. Do not time anything yourself, do not sleep, do not read
+            input, do not use the network and do not start servers or UIs; call the underlying functions
+            directly. Only provide the module, in a single ```python block.
+            """
+
+# Runs in the sandbox: time each benchmark and print a JSON report as the last line
+_BENCH_SCRIPT = """
+import json, time, traceback
+report = {}
+try:
+    from bench_main import BENCHMARKS
+except BaseException:
+    print(json.dumps({"__import__": {"error": traceback.format_exc(limit=3)}}))
+    sys.exit(0)
+repeat, max_seconds = int(sys.argv[3]), float(sys.argv[4])
+for budget_id in sys.argv[5:]:
+    fn = BENCHMARKS.get(budget_id)
+    if fn is None:
+        report[budget_id] = {"error": "no benchmark defined"}
+        continue
+    samples = []
+    try:
+        for _ in range(3):
+            fn()
+        deadline = time.perf_counter() + max_seconds
+        while len(samples) < repeat and time.perf_counter() < deadline:
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+    except BaseException:
+        report[budget_id] = {"error": traceback.format_exc(limit=3)}
+        continue
+    samples.sort()
+    report[budget_id] = {"samples": len(samples), "p50_ms": samples[len(samples) // 2],
+                         "p95_ms": samples[min(len(samples) - 1, int(0.95 * len(samples)))], "max_ms": samples[-1]}
+print(json.dumps(report))
+"""
+
+
+@dataclass
+class PerfBudget:
+    id: str
+    requirement: str
+    limit_ms: float
+
+    def to_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+
+def _requirement_texts(structured_req: str) -> List[str]:
+    """Every string in a JSON specification (fenced or not), or its lines if it is not JSON."""
+    data = parse_spec(structured_req)
+    if data is None:
+        return [line.strip(" -*\t") for line in structured_req.splitlines() if line.strip()]
+    texts, stack = [], [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(reversed(list(item.values())))
+        elif isinstance(item, list):
+            stack.extend(reversed(item))
+        elif isinstance(item, str):
+            texts.append(item)
+    return texts
+
+
+def extract_budgets(structured_req: str) -> List[PerfBudget]:
+    """Quantitative latency requirements, e.g. "Respond to user input within 100ms"."""
+    budgets, seen = [], set()
+    for text in _requirement_texts(structured_req):
+        match = _LATENCY.search(text)
+        if not match or text in seen:
+            continue
+        seen.add(text)
+        limit_ms = float(match.group(1)) * _unit_ms(match.group(2))
+        budgets.append(PerfBudget(id=f"perf-{len(budgets) + 1}", requirement=text, limit_ms=limit_ms))
+    return budgets
+
+
+def format_budgets(budgets: List[PerfBudget]) -> str:
+    return "\n".join(f"- {budget.id}: {budget.requirement} (budget {budget.limit_ms:g} ms)" for budget in budgets)
+
+
+def run_benchmarks(code: str, benchmarks: str, budgets: List[PerfBudget], repeat: int = 50,
+                   max_seconds: float = 2.0, memory_mb: int = DEFAULT_MEMORY_MB) -> Dict:
+    """Time each benchmark in one sandboxed subprocess and compare its p95 with the budget.
+
+    Benchmarks run sequentially so they do not compete for the CPU. A budget
+    is violated when the 95th percentile latency exceeds it; a benchmark
+    that fails to run is reported as an error, not a violation.
+    """
+    workspace = prepare_workspace(code, benchmarks, BENCH_MODULE)
+    timeout = 30 + len(budgets) * (max_seconds + 5)
+    try:
+        with span("run benchmarks", cat="test", budgets=len(budgets)):
+            completed = run_sandboxed(workspace, _BENCH_SCRIPT,
+                                      [str(repeat), str(max_seconds), *[budget.id for budget in budgets]],
+                                      timeout=timeout, memory_mb=memory_mb)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    lines = completed["stdout"].strip().splitlines()
+    try:
+        measured = json.loads(lines[-1]) if lines else {}
+    except ValueError:
+        measured = {}
+    if not measured:
+        reason = "timed out" if completed["returncode"] is None else (completed["stderr"] or "no output")[-800:]
+        measured = {"__import__": {"error": f"benchmark run failed: {reason}"}}
+    import_error = measured.get("__import__", {}).get("error")
+
+    results = []
+    for budget in budgets:
+        result = dict(budget.to_dict(), **(measured.get(budget.id) or {"error": import_error or "not run"}))
+        if "error" in result:
+            result["outcome"] = "error"
+        else:
+            result["outcome"] = "violated" if result["p95_ms"] > budget.limit_ms else "met"
+        results.append(result)
+    return {
+        "passed": all(result["outcome"] != "violated" for result in results),
+        "violations": sum(result["outcome"] == "violated" for result in results),
+        "errors": sum(result["outcome"] == "error" for result in results),
+        "results": results,
+    }
+
+
+def benchmark_issues(report: Dict) -> List[ReviewIssue]:
+    """Blocking review issues for violated budgets.
+
+    Measurements go in the feedback (format_violations) rather than the
+    issue, so a budget that stays violated is recognised as a repeated issue.
+    """
+    return [
+        ReviewIssue(severity="major", location=f"performance budget {result['id']}",
+                    description=f"'{result['requirement']}' is not met (budget {result['limit_ms']:g} ms)")
+        for result in report["results"] if result["outcome"] == "violated"
+    ]
+
+
+def format_violations(report: Dict) -> str:
+    """Describe violated latency budgets as feedback for the coding agent."""
+    violated = [result for result in report["results"] if result["outcome"] == "violated"]
+    if not violated:
+        return ""
+    lines = [f"{len(violated)} performance requirement(s) failed when benchmarked locally:"]
+    for result in violated:
+        lines.append(f"- {result['requirement']}: p95 {result['p95_ms']:.2f} ms over {result['samples']} runs, "
+                     f"budget {result['limit_ms']:g} ms")
+    lines.append("Make these operations fast enough to meet their budgets; a warning printed at runtime does not count.")
+    return "\n".join(lines)
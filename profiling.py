@@ -0,0 +1,291 @@
+import contextvars
+import json
+import os
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from tracing import Tracer
+
+# Directory for profile reports
+PROFILE_DIR = os.getenv("PROFILE_DIR", "output/profiles")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+_STDLIB = sysconfig.get_paths()["stdlib"]
+
+# Without per-thread CPU clocks, a thread whose innermost Python frame is in
+# one of these files or functions is taken to be blocked, not computing
+_WAIT_FILES = {"socket.py", "ssl.py", "selectors.py", "threading.py", "subprocess.py", "queue.py",
+               "connection.py", "_sync.py", "_backends.py", "sync.py"}
+_WAIT_FUNCTIONS = {"wait", "select", "poll", "sleep", "recv", "recv_into", "readinto", "read", "accept",
+                   "acquire", "_wait_for_tstate_lock", "communicate", "get"}
+
+
+def _union_seconds(intervals: List[Tuple[float, float]]) -> float:
+    """Length covered by possibly overlapping (start, end) intervals."""
+    total, current_start, current_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def _short(filename: str) -> str:
+    return os.path.relpath(filename, REPO_DIR) if filename.startswith(REPO_DIR) else filename
+
+
+def _package(filename: str) -> str:
+    """Who owns a source file: this repo, a third-party package or the standard library."""
+    if filename.startswith(REPO_DIR) and "site-packages" not in filename:
+        return "orchestration (this repo)"
+    if "site-packages" in filename:
+        return filename.split("site-packages" + os.sep, 1)[1].split(os.sep, 1)[0].split(".", 1)[0]
+    if filename.startswith(_STDLIB):
+        return "stdlib"
+    return "other"
+
+
+# Stages open in this context, innermost last; worker threads started with
+# tracing.wrap inherit it, so their LLM calls count towards the right stage
+_open_stages: contextvars.ContextVar = contextvars.ContextVar("profiled_stages", default=())
+
+
+# Profilers running at once (e.g. app sessions) share tracemalloc; the last one stops it
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def _stage_row() -> Dict:
+    return {"calls": 0, "wall_seconds": 0.0, "llm_seconds": 0.0, "llm_cpu_seconds": 0.0,
+            "local_seconds": 0.0, "cpu_seconds": 0.0, "alloc_peak_mb": 0.0}
+
+
+class Profiler:
+    """Profiles a traced run: where time goes besides waiting on the LLM.
+
+    - Per stage (``cat="stage"`` spans): wall time; time with an LLM call in
+      flight (union of ``cat="network"`` spans, including those of worker
+      threads) and the client CPU spent inside those calls (AutoGen message
+      bookkeeping, HTTP client), so the rest is network wait; local time
+      (wall minus LLM time: prompt building, parsing, saving, test runs);
+      process CPU time; and the tracemalloc allocation peak.
+    - Hot spots: a sampling thread records every thread's stack. Threads
+      blocked on sockets, locks, queues or subprocesses count as waiting,
+      the rest as CPU, aggregated by function and by package.
+
+    CPU time, allocations and samples are process-wide, so concurrent runs
+    in one process (e.g. several app sessions) blur each other.
+    """
+
+    def __init__(self, tracer: Tracer, interval: float = 0.005, top: int = 15):
+        self.tracer = tracer
+        self.interval = interval
+        self.top = top
+        self.stages: Dict[str, Dict] = {}
+        self.samples = {"cpu": 0, "wait": 0}
+        self._self_time: Counter = Counter()
+        self._cumulative: Counter = Counter()
+        self._packages: Counter = Counter()
+        # LLM calls as (start, end, client CPU seconds), per stage; None is the whole run
+        self._calls: Dict[Optional[str], List[Tuple[float, float, float]]] = {}
+        self._stack: List[Dict] = []
+        self._thread_cpu: Dict[int, float] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+
+    # Accounting through tracer listeners
+
+    def _on_span(self, phase: str, name: str, cat: str, args: Dict):
+        if cat == "stage":
+            self._on_stage(phase, name)
+        elif cat == "network":
+            self._on_call(phase)
+
+    def _on_call(self, phase: str):
+        # Calls nest within a thread, so a per-thread stack pairs begin and end
+        calls = self._local.__dict__.setdefault("calls", [])
+        if phase == "begin":
+            calls.append((time.perf_counter(), time.thread_time()))
+            return
+        if not calls:
+            return
+        started, cpu = calls.pop()
+        call = (started, time.perf_counter(), time.thread_time() - cpu)
+        with self._lock:
+            for stage in {None, *_open_stages.get()}:
+                self._calls.setdefault(stage, []).append(call)
+
+    def _on_stage(self, phase: str, name: str):
+        # Stages run on the pipeline thread and nest (e.g. chunked review inside
+        # code review); a nested stage's allocation peak also counts for its parents
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        if phase == "begin":
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            token = _open_stages.set(_open_stages.get() + (name,))
+            self._stack.append({"stage": name, "token": token, "started": time.perf_counter(),
+                                "cpu": time.process_time(), "peak": 0})
+            return
+        if not self._stack:
+            return
+        entry = self._stack.pop()
+        _open_stages.reset(entry["token"])
+        entry["peak"] = max(entry["peak"], peak)
+        if self._stack:
+            self._stack[-1]["peak"] = max(self._stack[-1]["peak"], entry["peak"])
+        with self._lock:
+            row = self.stages.setdefault(name, _stage_row())
+            row["calls"] += 1
+            row["wall_seconds"] += time.perf_counter() - entry["started"]
+            row["cpu_seconds"] += time.process_time() - entry["cpu"]
+            row["alloc_peak_mb"] = max(row["alloc_peak_mb"], entry["peak"] / 2 ** 20)
+
+    # Sampling
+
+    def _on_cpu(self, thread_id: int, frame, elapsed: float) -> bool:
+        """Whether a sampled thread was computing rather than blocked.
+
+        Uses the thread's CPU clock where available (Linux), otherwise guesses
+        from its innermost Python frame.
+        """
+        try:
+            cpu = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except (AttributeError, OSError):
+            code = frame.f_code
+            return os.path.basename(code.co_filename) not in _WAIT_FILES and code.co_name not in _WAIT_FUNCTIONS
+        used = cpu - self._thread_cpu.get(thread_id, cpu)
+        self._thread_cpu[thread_id] = cpu
+        return used >= elapsed * 0.2
+
+    def _sample(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if not self._on_cpu(thread_id, frame, elapsed):
+                    self.samples["wait"] += 1
+                    continue
+                code = frame.f_code
+                self.samples["cpu"] += 1
+                self._self_time[f"{code.co_name} ({_short(code.co_filename)}:{frame.f_lineno})"] += 1
+                self._packages[_package(code.co_filename)] += 1
+                seen = set()
+                while frame is not None:
+                    key = f"{frame.f_code.co_name} ({_short(frame.f_code.co_filename)})"
+                    if key not in seen:
+                        seen.add(key)
+                        self._cumulative[key] += 1
+                    frame = frame.f_back
+
+    def __enter__(self) -> "Profiler":
+        global _tracemalloc_users
+        with _tracemalloc_lock:
+            if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            _tracemalloc_users += 1
+        self._started_at = time.perf_counter()
+        self._cpu_at = time.process_time()
+        self.tracer.listeners.append(self._on_span)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._sampler.join()
+        self.tracer.listeners.remove(self._on_span)
+        self.wall_seconds = time.perf_counter() - self._started_at
+        self.cpu_seconds = time.process_time() - self._cpu_at
+        # Stages reset the peak, so the run's peak is the largest seen by any of them
+        self.alloc_peak_mb = max([tracemalloc.get_traced_memory()[1] / 2 ** 20] +
+                                 [row["alloc_peak_mb"] for row in self.stages.values()])
+        global _tracemalloc_users
+        with _tracemalloc_lock:
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0:
+                tracemalloc.stop()
+
+    # Report
+
+    def _llm_time(self, stage: Optional[str]) -> Tuple[float, float]:
+        """Seconds with an LLM call in flight, and client CPU seconds inside calls."""
+        calls = self._calls.get(stage, [])
+        return (_union_seconds([(start, end) for start, end, _ in calls]),
+                sum(cpu for _, _, cpu in calls))
+
+    def report(self) -> Dict:
+        stages = {}
+        for name, row in self.stages.items():
+            llm, llm_cpu = self._llm_time(name)
+            stages[name] = dict(row, llm_seconds=llm, llm_cpu_seconds=llm_cpu,
+                                local_seconds=max(0.0, row["wall_seconds"] - llm))
+        llm, llm_cpu = self._llm_time(None)
+        cpu_samples = self.samples["cpu"] or 1
+        as_share = lambda counter: [{"where": key, "share": count / cpu_samples}
+                                    for key, count in counter.most_common(self.top)]
+        return {
+            "run_id": self.tracer.run_id,
+            "wall_seconds": self.wall_seconds,
+            "llm_calls": len(self._calls.get(None, [])),
+            "llm_seconds": llm,
+            "llm_cpu_seconds": llm_cpu,
+            "network_wait_seconds": max(0.0, llm - llm_cpu),
+            "local_seconds": max(0.0, self.wall_seconds - llm),
+            "cpu_seconds": self.cpu_seconds,
+            "alloc_peak_mb": self.alloc_peak_mb,
+            "samples": dict(self.samples, interval_ms=self.interval * 1000),
+            "stages": stages,
+            "hot_spots": as_share(self._self_time),
+            "cumulative": as_share(self._cumulative),
+            "packages": as_share(self._packages),
+        }
+
+
+def format_report(report: Dict) -> str:
+    lines = [
+        f"Run {report['run_id']}: {report['wall_seconds']:.2f}s wall, {report['llm_seconds']:.2f}s in "
+        f"{report['llm_calls']} LLM calls ({report['network_wait_seconds']:.2f}s network wait, "
+        f"{report['llm_cpu_seconds']:.2f}s client CPU), {report['local_seconds']:.2f}s local; "
+        f"{report['cpu_seconds']:.2f}s CPU, allocation peak {report['alloc_peak_mb']:.1f} MB",
+        "",
+        f"{'stage':<32}{'calls':>6}{'wall s':>9}{'llm s':>8}{'client cpu s':>14}{'local s':>9}"
+        f"{'cpu s':>8}{'alloc MB':>10}",
+    ]
+    for name, stage in sorted(report["stages"].items(), key=lambda item: -item[1]["wall_seconds"]):
+        lines.append(f"{name:<32}{stage['calls']:>6}{stage['wall_seconds']:>9.2f}{stage['llm_seconds']:>8.2f}"
+                     f"{stage['llm_cpu_seconds']:>14.2f}{stage['local_seconds']:>9.2f}{stage['cpu_seconds']:>8.2f}"
+                     f"{stage['alloc_peak_mb']:>10.1f}")
+    sections = [("CPU by package", report["packages"]), ("Hot spots (self)", report["hot_spots"]),
+                ("Hot spots (cumulative)", report["cumulative"])]
+    lines += ["", f"{report['samples']['cpu']} CPU samples, {report['samples']['wait']} waiting, "
+                  f"every {report['samples']['interval_ms']:g} ms"]
+    for title, entries in sections:
+        lines += ["", f"{title}:"] + [f"  {entry['share']:>6.1%}  {entry['where']}" for entry in entries]
+    return "\n".join(lines)
+
+
+def save_report(report: Dict, directory: str = PROFILE_DIR) -> str:
+    """Write the report as JSON and text; returns the text report's path."""
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"profile_{report['run_id']}")
+    with open(base + ".json", "w") as f:
+        json.dump(report, f, indent=2)
+    with open(base + ".txt", "w") as f:
+        f.write(format_report(report) + "\n")
+    return base + ".txt"
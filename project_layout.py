@@ -0,0 +1,93 @@
+import json
+import os
+import re
+from typing import Dict
+
+# Marker separating files when a multi-file project travels as one text
+FILE_MARKER = "# === File: {path} ==="
+_MARKER_RE = re.compile(r"^# === File: (?P<path>[^\n]+?) ===[ \t]*$", re.M)
+
+# Instructions for the planning step
+PLAN_INSTRUCTIONS = """
+            Respond with a single JSON block in exactly this format:
+            ```json
+            {"package": "<python_package_name>",
+             "modules": [{"path": "<package>/<module>.py",
+                          "purpose": "<one sentence>",
+                          "interface": "<class and function signatures with one-line docstrings>",
+                          "depends_on": ["<package>/<other_module>.py"]}]}
+            ```
+            Keep modules cohesive, avoid circular imports and include a <package>/__main__.py entry point.
+            """
+
+
+def parse_module_plan(text: str) -> Dict:
+    """Parse the planner's JSON module layout."""
+    blocks = re.findall(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.S) or [text[text.find("{"):text.rfind("}") + 1]]
+    for block in blocks:
+        try:
+            plan = json.loads(block)
+        except ValueError:
+            continue
+        if isinstance(plan, dict) and plan.get("modules"):
+            break
+    else:
+        raise ValueError("Planner did not return a module layout")
+
+    package = re.sub(r"\W", "_", str(plan.get("package") or "app")).strip("_").lower() or "app"
+    modules = []
+    for module in plan["modules"]:
+        path = str(module.get("path", "")).strip().lstrip("/").replace("\\", "/")
+        if not path.endswith(".py") or ".." in path.split("/"):
+            continue
+        if not path.startswith(package + "/"):
+            path = f"{package}/{path.split('/')[-1]}"
+        modules.append({
+            "path": path,
+            "purpose": str(module.get("purpose", "")),
+            "interface": str(module.get("interface", "")),
+            "depends_on": [str(dep) for dep in module.get("depends_on") or []],
+        })
+    if not modules:
+        raise ValueError("Planner returned no usable modules")
+    return {"package": package, "modules": modules}
+
+
+def format_interfaces(plan: Dict) -> str:
+    """Render the planned interfaces of every module for the coding prompts."""
+    return "\n\n".join(
+        f"{module['path']}: {module['purpose']}\n{module['interface']}" for module in plan["modules"]
+    )
+
+
+def join_project(files: Dict[str, str]) -> str:
+    """Bundle a multi-file project into one text with file markers."""
+    return "\n\n".join(f"{FILE_MARKER.format(path=path)}\n{source.strip()}\n" for path, source in files.items())
+
+
+def split_project(bundle: str) -> Dict[str, str]:
+    """Split a bundle produced by join_project back into files."""
+    matches = list(_MARKER_RE.finditer(bundle))
+    files = {}
+    for index, match in enumerate(matches):
+        path = match.group("path").strip().replace("\\", "/")
+        if os.path.isabs(path) or ".." in path.split("/"):
+            continue
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(bundle)
+        files[path] = bundle[match.end():end].strip() + "\n"
+    return files
+
+
+def is_project_bundle(code: str) -> bool:
+    return bool(_MARKER_RE.search(code))
+
+
+def with_package_inits(files: Dict[str, str]) -> Dict[str, str]:
+    """Add an empty __init__.py to every package directory that lacks one."""
+    files = dict(files)
+    for path in list(files):
+        directory = os.path.dirname(path)
+        while directory:
+            files.setdefault(f"{directory}/__init__.py", "")
+            directory = os.path.dirname(directory)
+    return files
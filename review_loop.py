@@ -0,0 +1,233 @@
+import difflib
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Severities that keep code from passing review
+SEVERITIES = ("critical", "major", "minor", "info")
+BLOCKING_SEVERITIES = {"critical", "major"}
+
+# Appended to the review prompt so the verdict can be parsed reliably
+VERDICT_INSTRUCTIONS = """
+            End your review with a JSON block in exactly this format:
+            ```json
+            {"verdict": "PASS" or "NEEDS_REVISION",
+             "issues": [{"severity": "critical|major|minor|info", "location": "<function/class/line>", "description": "<what is wrong>"}]}
+            ```
+            Use "critical" or "major" only for issues that must be fixed before the code can ship.
+            """
+
+
+@dataclass
+class ReviewIssue:
+    severity: str
+    description: str
+    location: str = ""
+
+    @property
+    def blocking(self) -> bool:
+        return self.severity in BLOCKING_SEVERITIES
+
+    def fingerprint(self) -> str:
+        """Normalised identity used to spot issues that repeat across reviews."""
+        text = re.sub(r"[^a-z0-9 ]", "", f"{self.location} {self.description}".lower())
+        return " ".join(text.split())
+
+
+@dataclass
+class ReviewVerdict:
+    verdict: str
+    issues: List[ReviewIssue] = field(default_factory=list)
+    structured: bool = True
+    # Set when merging chunk verdicts: a chunk that failed without listing issues
+    # still fails the whole review, whatever the merged issues say
+    decision: Optional[bool] = None
+
+    @property
+    def blocking_issues(self) -> List[ReviewIssue]:
+        return [issue for issue in self.issues if issue.blocking]
+
+    @property
+    def passed(self) -> bool:
+        if self.decision is not None:
+            return self.decision
+        if self.issues:
+            return not self.blocking_issues
+        return self.verdict == "PASS"
+
+    def to_dict(self) -> Dict:
+        return {
+            "verdict": self.verdict,
+            "passed": self.passed,
+            "structured": self.structured,
+            "issues": [issue.__dict__ for issue in self.issues],
+        }
+
+
+def _normalise_severity(value) -> str:
+    severity = str(value or "").strip().lower()
+    aliases = {"blocker": "critical", "high": "major", "medium": "minor", "low": "info", "major issue": "major"}
+    severity = aliases.get(severity, severity)
+    return severity if severity in SEVERITIES else "minor"
+
+
+def _normalise_verdict(value) -> str:
+    verdict = re.sub(r"[^A-Z]", "_", str(value or "").upper()).strip("_")
+    if verdict in ("PASS", "PASSED", "APPROVED"):
+        return "PASS"
+    return "NEEDS_REVISION"
+
+
+def _json_candidates(text: str) -> List[str]:
+    """JSON blobs in a review, the last (most likely verdict) block first."""
+    candidates = re.findall(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.S)[::-1]
+    start = text.rfind('{"verdict"')
+    if start != -1:
+        candidates.append(text[start:text.rfind("}") + 1])
+    return candidates
+
+
+def parse_review_verdict(review_content: str) -> ReviewVerdict:
+    """Parse the reviewer's JSON verdict, falling back to an explicit verdict line."""
+    for candidate in _json_candidates(review_content):
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if not isinstance(data, dict) or "verdict" not in data:
+            continue
+        issues = [
+            ReviewIssue(
+                severity=_normalise_severity(item.get("severity")),
+                description=str(item.get("description", "")).strip(),
+                location=str(item.get("location", "")).strip(),
+            )
+            for item in data.get("issues") or []
+            if isinstance(item, dict)
+        ]
+        return ReviewVerdict(verdict=_normalise_verdict(data["verdict"]), issues=issues)
+
+    # Unstructured review: trust only an explicit verdict statement, never a
+    # stray "pass" inside the prose (e.g. "passes the wrong value").
+    upper = review_content.upper()
+    match = re.search(r"(?:VERDICT|DECISION)\W{0,5}(PASS(?:ES|ED)?|NEEDS[ _]REVISION|REVISION NEEDED)", upper)
+    if match:
+        verdict = "PASS" if match.group(1).startswith("PASS") else "NEEDS_REVISION"
+    elif re.search(r"\bNEEDS[ _]REVISION\b|\bREVISION NEEDED\b", upper):
+        verdict = "NEEDS_REVISION"
+    elif re.search(r"\b(?:CODE|IT) PASSES\b|\bPASSES (?:THE )?REVIEW\b", upper):
+        verdict = "PASS"
+    else:
+        verdict = "NEEDS_REVISION"
+    return ReviewVerdict(verdict=verdict, structured=False)
+
+
+def merge_verdicts(verdicts: List[ReviewVerdict], similarity: float = 0.85) -> ReviewVerdict:
+    """Merge per-chunk verdicts into one, dropping duplicate and near-duplicate issues.
+
+    When two issues match, the more severe one is kept.
+    """
+    merged: List[ReviewIssue] = []
+    for issue in (issue for verdict in verdicts for issue in verdict.issues):
+        fingerprint = issue.fingerprint()
+        for index, kept in enumerate(merged):
+            if difflib.SequenceMatcher(None, fingerprint, kept.fingerprint()).ratio() >= similarity:
+                if SEVERITIES.index(issue.severity) < SEVERITIES.index(kept.severity):
+                    merged[index] = issue
+                break
+        else:
+            merged.append(issue)
+    passed = all(verdict.passed for verdict in verdicts)
+    return ReviewVerdict(
+        verdict="PASS" if passed else "NEEDS_REVISION",
+        issues=sorted(merged, key=lambda issue: SEVERITIES.index(issue.severity)),
+        structured=any(verdict.structured for verdict in verdicts),
+        decision=passed,
+    )
+
+
+def format_verdict(verdict: ReviewVerdict) -> str:
+    """Render a verdict as the JSON block reviewers are asked to produce."""
+    data = {"verdict": verdict.verdict, "issues": [issue.__dict__ for issue in verdict.issues]}
+    return f"```json\n{json.dumps(data, indent=2)}\n```"
+
+
+def change_ratio(old: str, new: str) -> float:
+    """Fraction of the code that changed between two revisions (0 = identical)."""
+    if old == new:
+        return 0.0
+    return 1.0 - difflib.SequenceMatcher(None, old.splitlines(), new.splitlines(), autojunk=False).ratio()
+
+
+class ReviewLoopController:
+    """Decides when the review/revise loop should stop.
+
+    Stops when blocking issues are gone, when revisions stop converging
+    (the diff is below ``min_change`` or the same blocking issues come back)
+    or when the token/time budget for the loop is spent.
+    """
+
+    def __init__(self, max_iterations: int = 3, min_change: float = 0.02,
+                 token_budget: Optional[int] = None, time_budget: Optional[float] = None):
+        self.max_iterations = max_iterations
+        self.min_change = min_change
+        self.token_budget = token_budget
+        self.time_budget = time_budget
+        self.reset()
+
+    def reset(self):
+        self.iteration = 0
+        self.tokens_used = 0
+        self.started_at = time.monotonic()
+        self.stop_reason = ""
+        self.history: List[Dict] = []
+        self._last_fingerprints = None
+
+    def add_tokens(self, tokens: int):
+        self.tokens_used += tokens
+
+    def _out_of_budget(self) -> Optional[str]:
+        if self.token_budget is not None and self.tokens_used >= self.token_budget:
+            return f"token budget exhausted ({self.tokens_used}/{self.token_budget})"
+        if self.time_budget is not None and time.monotonic() - self.started_at >= self.time_budget:
+            return f"time budget exhausted ({self.time_budget:.0f}s)"
+        return None
+
+    def _stop(self, reason: str) -> Tuple[bool, str]:
+        self.stop_reason = reason
+        return False, reason
+
+    def after_review(self, verdict: ReviewVerdict) -> Tuple[bool, str]:
+        """Return (revise, reason) once a review has come back."""
+        fingerprints = frozenset(issue.fingerprint() for issue in verdict.blocking_issues)
+        self.history.append({"iteration": self.iteration, "verdict": verdict.to_dict()})
+
+        if verdict.passed:
+            return self._stop("no blocking issues")
+        if self._last_fingerprints is not None and fingerprints and fingerprints == self._last_fingerprints:
+            return self._stop("same blocking issues repeated")
+        self._last_fingerprints = fingerprints
+        if self.iteration >= self.max_iterations:
+            return self._stop(f"reached {self.max_iterations} iterations")
+        budget = self._out_of_budget()
+        if budget:
+            return self._stop(budget)
+        if verdict.blocking_issues:
+            return True, f"{len(verdict.blocking_issues)} blocking issue(s)"
+        return True, "reviewer asked for revision"
+
+    def after_revision(self, old_code: str, new_code: str) -> Tuple[bool, str]:
+        """Return (review_again, reason) once a revision has come back."""
+        self.iteration += 1
+        changed = change_ratio(old_code, new_code)
+        self.history[-1]["change"] = changed
+        if self.iteration >= self.max_iterations:
+            return self._stop(f"reached {self.max_iterations} iterations")
+        if changed < self.min_change:
+            return self._stop(f"revision changed {changed:.1%} of the code (< {self.min_change:.0%})")
+        budget = self._out_of_budget()
+        if budget:
+            return self._stop(budget)
+        return True, f"revision changed {changed:.1%} of the code"
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional
+
+# Local SQLite ledger of every pipeline run; empty disables recording
+RUN_LEDGER = os.getenv("RUN_LEDGER", "output/runs.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT NOT NULL,
+    error TEXT,
+    model TEXT,
+    requirement TEXT,
+    review_passed INTEGER,
+    review_iterations INTEGER,
+    review_stop_reason TEXT,
+    tests_passed INTEGER,
+    calls INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cost REAL,
+    duration REAL,
+    trace_path TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_started_at ON runs (started_at);
+CREATE INDEX IF NOT EXISTS runs_iterations ON runs (review_iterations, started_at);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status, started_at);
+
+CREATE TABLE IF NOT EXISTS stages (
+    run_id TEXT NOT NULL REFERENCES runs (id),
+    stage TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS stages_stage ON stages (stage, started_at);
+CREATE INDEX IF NOT EXISTS stages_run ON stages (run_id);
+
+CREATE TABLE IF NOT EXISTS calls (
+    run_id TEXT NOT NULL REFERENCES runs (id),
+    agent TEXT NOT NULL,
+    started_at REAL,
+    duration REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cost REAL
+);
+CREATE INDEX IF NOT EXISTS calls_agent ON calls (agent, started_at);
+CREATE INDEX IF NOT EXISTS calls_run ON calls (run_id);
+
+CREATE TABLE IF NOT EXISTS verdicts (
+    run_id TEXT NOT NULL REFERENCES runs (id),
+    iteration INTEGER NOT NULL,
+    verdict TEXT,
+    passed INTEGER,
+    issues TEXT
+);
+CREATE INDEX IF NOT EXISTS verdicts_run ON verdicts (run_id);
+
+CREATE TABLE IF NOT EXISTS outputs (
+    run_id TEXT NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    content TEXT,
+    PRIMARY KEY (run_id, name)
+);
+"""
+
+# Stage outputs kept from the results of a run
+OUTPUT_FIELDS = ("structured_requirement", "code", "documentation", "tests", "ui_code")
+
+
+def call_cost(call: Dict, price: Optional[List[float]]) -> Optional[float]:
+    """Cost of one call from a [prompt, completion] price per 1k tokens."""
+    if not price:
+        return None
+    return (call["prompt_tokens"] * price[0] + call["completion_tokens"] * price[1]) / 1000
+
+
+class RunLedger:
+    """Records every pipeline run in a local SQLite database."""
+
+    def __init__(self, path: str = RUN_LEDGER):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def start_run(self, run_id: str, requirement: str, model: str, started_at: float):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO runs (id, started_at, status, model, requirement) VALUES (?, ?, 'running', ?, ?)",
+                         (run_id, started_at, model, requirement))
+
+    def finish_run(self, run_id: str, results: Optional[Dict], calls: List[Dict], stages: List[Dict],
+                   price: Optional[List[float]] = None, error: Optional[str] = None):
+        """Store the outcome, stage timings, agent calls, verdicts and outputs of a run."""
+        finished_at = time.time()
+        results = results or {}
+        costs = [call_cost(call, price) for call in calls]
+        test_results = results.get("test_results")
+        with self._connect() as conn:
+            started_at = conn.execute("SELECT started_at FROM runs WHERE id = ?", (run_id,)).fetchone()["started_at"]
+            conn.execute(
+                """UPDATE runs SET finished_at = ?, status = ?, error = ?, review_passed = ?, review_iterations = ?,
+                   review_stop_reason = ?, tests_passed = ?, calls = ?, prompt_tokens = ?, completion_tokens = ?,
+                   cost = ?, duration = ?, trace_path = ? WHERE id = ?""",
+                (finished_at, "failed" if error else "completed", error,
+                 None if "review_passed" not in results else int(results["review_passed"]),
+                 results.get("review_iterations"), results.get("review_stop_reason"),
+                 None if not test_results else int(test_results["passed"]),
+                 len(calls), sum(call["prompt_tokens"] for call in calls),
+                 sum(call["completion_tokens"] for call in calls),
+                 None if price is None else sum(costs), finished_at - started_at,
+                 results.get("trace_path"), run_id),
+            )
+            conn.executemany(
+                "INSERT INTO stages (run_id, stage, started_at, duration, error) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, stage["stage"], stage["started_at"], stage["duration"], stage.get("error"))
+                 for stage in stages],
+            )
+            conn.executemany(
+                "INSERT INTO calls (run_id, agent, started_at, duration, prompt_tokens, completion_tokens, cost) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, call["agent"], call.get("started_at"), call["seconds"], call["prompt_tokens"],
+                  call["completion_tokens"], cost) for call, cost in zip(calls, costs)],
+            )
+            conn.executemany(
+                "INSERT INTO verdicts (run_id, iteration, verdict, passed, issues) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, entry["iteration"], entry["verdict"]["verdict"], int(entry["verdict"]["passed"]),
+                  json.dumps(entry["verdict"]["issues"])) for entry in results.get("review_history") or []],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO outputs (run_id, name, content) VALUES (?, ?, ?)",
+                [(run_id, name, results[name]) for name in OUTPUT_FIELDS if results.get(name) is not None]
+                + ([(run_id, "test_results", json.dumps(test_results))] if test_results else []),
+            )
+
+    def load_run(self, run_id: Optional[str] = None) -> Optional[Dict]:
+        """Requirement and stage outputs of a completed run (the latest one by default)."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, requirement FROM runs WHERE status = 'completed'" + (" AND id = ?" if run_id else "") +
+                " ORDER BY started_at DESC LIMIT 1", (run_id,) if run_id else (),
+            ).fetchone()
+            if row is None:
+                return None
+            outputs = conn.execute("SELECT name, content FROM outputs WHERE run_id = ?", (row["id"],)).fetchall()
+        return dict({output["name"]: output["content"] for output in outputs},
+                    run_id=row["id"], requirement=row["requirement"])
+
+    def query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def stage_latency(self, since: float, percentiles=(0.5, 0.95)) -> List[Dict]:
+        """Latency percentiles per stage for stages started after `since`."""
+        rows = self.query("SELECT stage, duration FROM stages WHERE started_at >= ? ORDER BY stage, duration", (since,))
+        by_stage: Dict[str, List[float]] = {}
+        for row in rows:
+            by_stage.setdefault(row["stage"], []).append(row["duration"])
+        report = []
+        for stage, durations in by_stage.items():
+            entry = {"stage": stage, "count": len(durations)}
+            for pct in percentiles:
+                entry[f"p{int(pct * 100)}"] = durations[min(len(durations) - 1, int(pct * len(durations)))]
+            report.append(entry)
+        return report
+
+    def runs_with_iterations(self, iterations: int, since: float = 0) -> List[sqlite3.Row]:
+        return self.query(
+            "SELECT id, started_at, review_iterations, review_passed, duration, substr(requirement, 1, 60) AS requirement "
+            "FROM runs WHERE review_iterations >= ? AND started_at >= ? ORDER BY started_at DESC",
+            (iterations, since),
+        )
+
+
+def stages_from_trace(events: List[Dict], origin: float) -> List[Dict]:
+    """Per-stage timings from a run's trace spans (category "stage")."""
+    return [
+        {"stage": event["name"], "started_at": origin + event["ts"] / 1e6, "duration": event["dur"] / 1e6,
+         "error": event["args"].get("error")}
+        for event in events if event.get("ph") == "X" and event.get("cat") == "stage"
+    ]
+
+
+def _parse_since(text: str) -> float:
+    units = {"h": 3600, "d": 86400, "w": 7 * 86400}
+    if text and text[-1] in units:
+        return time.time() - float(text[:-1]) * units[text[-1]]
+    return time.time() - float(text)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Query the pipeline run ledger.")
+    parser.add_argument("--db", default=RUN_LEDGER or "output/runs.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    latency = commands.add_parser("latency", help="stage latency percentiles")
+    latency.add_argument("--since", default="7d", help="e.g. 24h, 7d, 2w")
+
+    runs = commands.add_parser("runs", help="list runs that needed many review iterations")
+    runs.add_argument("--iterations", type=int, default=3)
+    runs.add_argument("--since", default="30d")
+
+    sql = commands.add_parser("sql", help="run an ad-hoc query")
+    sql.add_argument("query")
+
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        print(f"No run ledger at {args.db}", file=sys.stderr)
+        return 1
+    ledger = RunLedger(args.db)
+
+    if args.command == "latency":
+        print(f"{'stage':<36}{'runs':>6}{'p50 (s)':>10}{'p95 (s)':>10}")
+        for entry in ledger.stage_latency(_parse_since(args.since)):
+            print(f"{entry['stage']:<36}{entry['count']:>6}{entry['p50']:>10.2f}{entry['p95']:>10.2f}")
+    elif args.command == "runs":
+        for row in ledger.runs_with_iterations(args.iterations, _parse_since(args.since)):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["started_at"]))
+            print(f"{row['id']}  {when}  iterations={row['review_iterations']}  "
+                  f"passed={bool(row['review_passed'])}  {row['duration'] or 0:.0f}s  {row['requirement']}")
+    else:
+        rows = ledger.query(args.query)
+        if rows:
+            print("\t".join(rows[0].keys()))
+        for row in rows:
+            print("\t".join(str(value) for value in row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
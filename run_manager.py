@@ -0,0 +1,173 @@
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from daemon import install_output_router, route_output
+from scheduler import INTERACTIVE, TENANT, default_scheduler
+from tracing import TRACE_DIR, Tracer, activate, span
+
+# Pipeline runs executing at once in the app's shared worker pool
+RUN_WORKERS = int(os.getenv("RUN_WORKERS", "2"))
+# Finished runs stay available for reattaching this long
+RUN_RETENTION_SECONDS = int(os.getenv("RUN_RETENTION_SECONDS", "3600"))
+
+# Top-level stages of a run, in order, for the progress fraction
+PIPELINE_STAGES = [
+    ("run_requirement_analysis", "Requirement analysis"),
+    ("run_code_development", "Code development"),
+    ("run_code_review", "Code review"),
+    ("run_test_generation", "Test generation"),
+    ("run_test_execution", "Test execution"),
+    ("run_documentation_generation", "Documentation"),
+    ("run_streamlit_ui_generation", "UI generation"),
+    ("run_ui_lint", "UI performance check"),
+]
+# Stages of an incremental run (an edit of a previous run's requirement)
+INCREMENTAL_STAGES = [
+    ("run_requirement_delta", "Specification update"),
+    ("run_code_patch", "Code patch"),
+    ("run_test_update", "Test update"),
+    ("run_test_execution", "Test execution"),
+    ("run_documentation_update", "Documentation update"),
+    ("run_ui_update", "UI update"),
+    ("run_ui_lint", "UI performance check"),
+]
+STAGE_LABELS = dict(PIPELINE_STAGES + INCREMENTAL_STAGES)
+
+
+@dataclass
+class RunHandle:
+    """State of one background pipeline run, safe to read from any session."""
+
+    id: str
+    requirement: str
+    profile: bool = False
+    previous: Optional[Dict] = None
+    tenant: str = TENANT
+    submitted_at: float = field(default_factory=time.time)
+    status: str = "queued"  # queued, running, completed, failed
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    events: List[Dict] = field(default_factory=list)
+    log: List[str] = field(default_factory=list)
+    results: Optional[Dict] = None
+    error: Optional[str] = None
+    tracer: Optional[Tracer] = None
+    stages_done: set = field(default_factory=set)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    @property
+    def progress(self) -> float:
+        if self.status == "completed":
+            return 1.0
+        stages = INCREMENTAL_STAGES if self.previous else PIPELINE_STAGES
+        return min(1.0, len(self.stages_done) / len(stages))
+
+    @property
+    def current(self) -> str:
+        """The latest progress event as text."""
+        if not self.events:
+            return "Waiting for a free worker..." if self.status == "queued" else "Starting..."
+        return self.events[-1]["text"]
+
+    def _event(self, kind: str, text: str):
+        self.events.append({"time": time.time(), "kind": kind, "text": text})
+
+    def on_span(self, phase: str, name: str, cat: str, args: Dict):
+        """Tracer listener turning stage and loop spans into progress events."""
+        if cat == "stage" and name in STAGE_LABELS:
+            if phase == "begin":
+                self._event("stage_started", f"{STAGE_LABELS[name]} started")
+            else:
+                self.stages_done.add(name)
+                outcome = "failed" if "error" in args else "finished"
+                self._event("stage_finished", f"{STAGE_LABELS[name]} {outcome}")
+        elif cat == "loop" and phase == "begin":
+            self._event("iteration", f"{name.capitalize()} of {args.get('of', '?')}")
+
+
+class RunManager:
+    """Shared background worker pool for pipeline runs.
+
+    One instance serves every session of a Streamlit server. Each worker
+    borrows a pipeline system from a pool (built on first use and reused,
+    as in the daemon), so concurrent runs never share state. Sessions keep
+    only the run id and poll the handle, so a refresh or disconnect does
+    not lose the run.
+    """
+
+    def __init__(self, factory: Callable, workers: int = RUN_WORKERS,
+                 retention: float = RUN_RETENTION_SECONDS):
+        self.factory = factory
+        # Several runs in flight share the LLM slots with the daemon and job workers
+        self.scheduler = default_scheduler(workers)
+        self.retention = retention
+        self._runs: Dict[str, RunHandle] = {}
+        self._systems: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline-run")
+        install_output_router()
+
+    def submit(self, requirement: str, profile: bool = False, previous: Optional[Dict] = None,
+               tenant: str = TENANT) -> RunHandle:
+        self._prune()
+        handle = RunHandle(id=time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6], requirement=requirement,
+                           profile=profile, previous=previous, tenant=tenant)
+        with self._lock:
+            self._runs[handle.id] = handle
+        self._executor.submit(self._run, handle)
+        return handle
+
+    def get(self, run_id: str) -> Optional[RunHandle]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            for run_id in [run_id for run_id, handle in self._runs.items()
+                           if handle.done and handle.finished_at < cutoff]:
+                del self._runs[run_id]
+
+    def _run(self, handle: RunHandle):
+        try:
+            system = self._systems.get_nowait()
+        except queue.Empty:
+            system = None
+        handle.status, handle.started_at = "running", time.time()
+        handle.tracer = Tracer(handle.id)
+        handle.tracer.listeners.append(handle.on_span)
+        try:
+            with route_output(handle.log.append), activate(handle.tracer), span("streamlit run", cat="ui"):
+                if system is None:
+                    print("Initializing agents...")
+                    system = self.factory(scheduler=self.scheduler)
+                system.profile = handle.profile
+                # A user is waiting on every app run
+                system.priority, system.tenant = INTERACTIVE, handle.tenant
+                handle.results = system.run_full_pipeline(handle.requirement, previous=handle.previous,
+                                                         run_id=handle.id)
+            status = "completed"
+        except Exception:
+            handle.error = traceback.format_exc()
+            status = "failed"
+        if TRACE_DIR:
+            try:
+                handle.tracer.export()
+            except OSError:
+                pass
+        if system is not None:
+            # The ledger already has this run's calls; keep a reused system from growing
+            system.call_log.clear()
+            self._systems.put(system)
+        handle.finished_at = time.time()
+        handle.status = status
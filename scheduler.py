@@ -0,0 +1,324 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from tracing import span
+
+# "auto" schedules agent calls only where several runs are in flight at once (an app or daemon with more
+# than one worker), "on" always (e.g. job workers next to the app), "off" never
+SCHEDULER = os.getenv("SCHEDULER", "auto").lower()
+# Agent calls share LLM slots through this file, across every process using it (app, daemon, job workers);
+# empty disables scheduling
+SCHEDULER_DB = os.getenv("SCHEDULER_DB", "output/scheduler.db")
+# Agent calls in flight at once across all those processes (0 disables scheduling)
+LLM_SLOTS = int(os.getenv("LLM_SLOTS", "8"))
+# Slots batch runs can never take, so an interactive call does not wait behind a full batch
+INTERACTIVE_RESERVED_SLOTS = int(os.getenv("INTERACTIVE_RESERVED_SLOTS", "1"))
+# Tenant weights for fair sharing of slots, e.g. "team-a=2,team-b=1" (others weigh 1)
+TENANT_SHARES = os.getenv("TENANT_SHARES", "")
+TENANT = os.getenv("TENANT", "default")
+# Slot usage this recent counts towards a tenant's fair share
+FAIR_SHARE_WINDOW = float(os.getenv("FAIR_SHARE_WINDOW", "600"))
+# A batch run pauses at a stage boundary at most this long for interactive calls waiting for slots
+PREEMPT_MAX_SECONDS = float(os.getenv("PREEMPT_MAX_SECONDS", "300"))
+
+# Priority classes, highest first
+INTERACTIVE, BATCH = "interactive", "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+# A waiter that stops polling (its process died) is dropped after this long
+WAITER_TIMEOUT_SECONDS = 10.0
+# A slot whose holder died is reclaimed after this long (well above the LLM timeout)
+SLOT_LEASE_SECONDS = 600.0
+# Finished tickets kept for fair sharing and metrics
+RETENTION_SECONDS = 86400.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id TEXT PRIMARY KEY,
+    priority TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    run_id TEXT,
+    enqueued_at REAL NOT NULL,
+    granted_at REAL,
+    released_at REAL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tickets_open ON tickets (released_at, granted_at);
+CREATE INDEX IF NOT EXISTS tickets_enqueued ON tickets (enqueued_at);
+
+CREATE TABLE IF NOT EXISTS preemptions (
+    run_id TEXT,
+    tenant TEXT NOT NULL,
+    stage TEXT,
+    started_at REAL NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS preemptions_started ON preemptions (started_at);
+"""
+
+
+def parse_shares(spec: str) -> Dict[str, float]:
+    """Tenant weights from "name=weight,..."."""
+    shares = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, weight = item.partition("=")
+        shares[name.strip()] = float(weight or 1)
+    return shares
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    return values[min(len(values) - 1, int(pct * len(values)))] if values else None
+
+
+@dataclass
+class Ticket:
+    id: str
+    priority: str
+    tenant: str
+    waited: float = 0.0
+
+
+def default_scheduler(concurrent_runs: int = 1) -> Optional["Scheduler"]:
+    """The shared scheduler for a process running up to concurrent_runs pipeline runs at once, or None.
+
+    With one run in flight, agent calls go straight to the provider unless SCHEDULER is "on".
+    """
+    if SCHEDULER == "off" or not SCHEDULER_DB or LLM_SLOTS <= 0:
+        return None
+    if SCHEDULER != "on" and concurrent_runs <= 1:
+        return None
+    return Scheduler(SCHEDULER_DB, LLM_SLOTS)
+
+
+class Scheduler:
+    """Priority and fair-share scheduling of agent calls over a fixed number of LLM slots.
+
+    Every agent call takes a slot for its duration. Waiting calls are
+    granted in priority-class order (interactive before batch); within a
+    class, the tenant holding the fewest slots, then using the fewest
+    slot-seconds recently (both relative to its share), goes first, and
+    calls of one tenant go in arrival order. Batch calls can never take the
+    last INTERACTIVE_RESERVED_SLOTS slots. Batch runs also pause at stage
+    boundaries while interactive calls are waiting (see yield_to_interactive).
+
+    State lives in a SQLite file, so processes sharing it share the slots.
+    """
+
+    def __init__(self, path: str = SCHEDULER_DB, slots: int = LLM_SLOTS,
+                 reserved: int = INTERACTIVE_RESERVED_SLOTS, shares: Optional[Dict[str, float]] = None,
+                 window: float = FAIR_SHARE_WINDOW, poll_seconds: float = 0.05):
+        if slots < 1:
+            raise ValueError("The scheduler needs at least one slot")
+        self.path = path
+        self.slots = slots
+        # Batch keeps at least one slot, or it could never run
+        self.batch_slots = max(1, slots - reserved)
+        self.shares = parse_shares(TENANT_SHARES) if shares is None else shares
+        self.window = window
+        self.poll_seconds = poll_seconds
+        self._pruned_at = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _share(self, tenant: str) -> float:
+        return self.shares.get(tenant, 1.0)
+
+    def _expire(self, conn: sqlite3.Connection, now: float):
+        """Drop waiters that stopped polling and reclaim slots whose holders died."""
+        conn.execute("DELETE FROM tickets WHERE granted_at IS NULL AND expires_at < ?", (now,))
+        conn.execute("UPDATE tickets SET released_at = expires_at WHERE granted_at IS NOT NULL "
+                     "AND released_at IS NULL AND expires_at < ?", (now,))
+        if now - self._pruned_at > 60:
+            conn.execute("DELETE FROM tickets WHERE released_at < ?", (now - RETENTION_SECONDS,))
+            conn.execute("DELETE FROM preemptions WHERE started_at < ?", (now - RETENTION_SECONDS,))
+            self._pruned_at = now
+
+    def _next(self, conn: sqlite3.Connection, now: float) -> Optional[str]:
+        """The waiting ticket to grant the next free slot to, if any slot is free for it."""
+        held = conn.execute("SELECT priority, tenant FROM tickets WHERE granted_at IS NOT NULL "
+                            "AND released_at IS NULL").fetchall()
+        if len(held) >= self.slots:
+            return None
+        waiting = conn.execute("SELECT id, priority, tenant, enqueued_at FROM tickets WHERE granted_at IS NULL "
+                               "ORDER BY enqueued_at").fetchall()
+        for priority in PRIORITIES:
+            candidates = [ticket for ticket in waiting if ticket["priority"] == priority]
+            if not candidates:
+                continue
+            if priority == BATCH and sum(row["priority"] == BATCH for row in held) >= self.batch_slots:
+                return None
+            holding: Dict[str, int] = {}
+            for row in held:
+                holding[row["tenant"]] = holding.get(row["tenant"], 0) + 1
+            usage = {row["tenant"]: row["seconds"] for row in conn.execute(
+                "SELECT tenant, SUM(MIN(COALESCE(released_at, ?), ?) - MAX(granted_at, ?)) AS seconds FROM tickets "
+                "WHERE priority = ? AND granted_at IS NOT NULL AND (released_at IS NULL OR released_at > ?) "
+                "GROUP BY tenant", (now, now, now - self.window, priority, now - self.window))}
+            best = min(candidates, key=lambda ticket: (holding.get(ticket["tenant"], 0) / self._share(ticket["tenant"]),
+                                                       usage.get(ticket["tenant"], 0.0) / self._share(ticket["tenant"]),
+                                                       ticket["enqueued_at"]))
+            return best["id"]
+        return None
+
+    def acquire(self, priority: str = INTERACTIVE, tenant: str = TENANT, run_id: Optional[str] = None) -> Ticket:
+        """Wait for a slot; release it with release()."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class {priority!r}; expected one of {', '.join(PRIORITIES)}")
+        ticket = Ticket(id=uuid.uuid4().hex, priority=priority, tenant=tenant)
+        enqueued = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT INTO tickets (id, priority, tenant, run_id, enqueued_at, expires_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (ticket.id, priority, tenant, run_id, enqueued, enqueued + WAITER_TIMEOUT_SECONDS))
+            try:
+                while True:
+                    now = time.time()
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        self._expire(conn, now)
+                        granted = self._next(conn, now) == ticket.id
+                        if granted:
+                            conn.execute("UPDATE tickets SET granted_at = ?, expires_at = ? WHERE id = ?",
+                                         (now, now + SLOT_LEASE_SECONDS, ticket.id))
+                        else:
+                            # Still polling: keep the ticket from being dropped as abandoned
+                            conn.execute("INSERT OR IGNORE INTO tickets (id, priority, tenant, run_id, enqueued_at, "
+                                         "expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                                         (ticket.id, priority, tenant, run_id, enqueued, now + WAITER_TIMEOUT_SECONDS))
+                            conn.execute("UPDATE tickets SET expires_at = ? WHERE id = ?",
+                                         (now + WAITER_TIMEOUT_SECONDS, ticket.id))
+                        conn.execute("COMMIT")
+                    except BaseException:
+                        conn.execute("ROLLBACK")
+                        raise
+                    if granted:
+                        ticket.waited = now - enqueued
+                        return ticket
+                    time.sleep(self.poll_seconds)
+            except BaseException:
+                # Interrupted while waiting: leave the queue
+                conn.execute("DELETE FROM tickets WHERE id = ? AND granted_at IS NULL", (ticket.id,))
+                raise
+
+    def release(self, ticket: Ticket):
+        with self._connect() as conn:
+            conn.execute("UPDATE tickets SET released_at = ? WHERE id = ? AND released_at IS NULL",
+                         (time.time(), ticket.id))
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE, tenant: str = TENANT, run_id: Optional[str] = None):
+        """Hold a slot for the duration of a block; yields the ticket (with the seconds waited)."""
+        with span("scheduler wait", cat="queue", priority=priority, tenant=tenant):
+            ticket = self.acquire(priority, tenant, run_id)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def interactive_waiting(self) -> int:
+        """Interactive calls currently waiting for a slot."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM tickets WHERE priority = ? AND granted_at IS NULL "
+                                "AND expires_at >= ?", (INTERACTIVE, time.time())).fetchone()[0]
+
+    def yield_to_interactive(self, tenant: str = TENANT, run_id: Optional[str] = None, stage: Optional[str] = None,
+                             max_seconds: float = PREEMPT_MAX_SECONDS) -> float:
+        """Pause a batch run at a stage boundary while interactive calls wait; returns the seconds paused.
+
+        Calls already in flight finish; the run just starts no new stage
+        until the interactive backlog has drained (or max_seconds passed,
+        so batch work is never starved for good).
+        """
+        started = time.time()
+        if not self.interactive_waiting():
+            return 0.0
+        with span("preempted", cat="queue", stage=stage):
+            while time.time() - started < max_seconds and self.interactive_waiting():
+                time.sleep(self.poll_seconds * 4)
+        paused = time.time() - started
+        with self._connect() as conn:
+            conn.execute("INSERT INTO preemptions (run_id, tenant, stage, started_at, seconds) VALUES (?, ?, ?, ?, ?)",
+                         (run_id, tenant, stage, started, paused))
+        return paused
+
+    def metrics(self, window: float = 300.0) -> Dict:
+        """Queue depth, slots in use and wait times per priority class and tenant, over the last window seconds."""
+        now = time.time()
+        since = now - window
+        with self._connect() as conn:
+            rows = conn.execute("SELECT priority, tenant, enqueued_at, granted_at, released_at, expires_at FROM tickets "
+                                "WHERE released_at IS NULL OR enqueued_at >= ?", (since,)).fetchall()
+            preemptions = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(seconds), 0) AS seconds FROM preemptions "
+                                       "WHERE started_at >= ?", (since,)).fetchone()
+        waiting = [row for row in rows if row["granted_at"] is None and row["expires_at"] >= now]
+        running = [row for row in rows if row["granted_at"] is not None and row["released_at"] is None]
+        classes = {}
+        for priority in PRIORITIES:
+            waits = sorted(row["granted_at"] - row["enqueued_at"] for row in rows
+                           if row["priority"] == priority and row["granted_at"] is not None
+                           and row["enqueued_at"] >= since)
+            queued = [row for row in waiting if row["priority"] == priority]
+            classes[priority] = {
+                "queued": len(queued),
+                "running": sum(row["priority"] == priority for row in running),
+                "granted": len(waits),
+                "wait_p50": _percentile(waits, 0.5),
+                "wait_p95": _percentile(waits, 0.95),
+                "wait_max": waits[-1] if waits else None,
+                "oldest_queued": max((now - row["enqueued_at"] for row in queued), default=None),
+            }
+        tenants = {}
+        for row in rows:
+            entry = tenants.setdefault(row["tenant"], {"queued": 0, "running": 0, "slot_seconds": 0.0,
+                                                       "share": self._share(row["tenant"])})
+            if row["granted_at"] is None:
+                entry["queued"] += row["expires_at"] >= now
+            else:
+                entry["running"] += row["released_at"] is None
+                entry["slot_seconds"] += (row["released_at"] or now) - max(row["granted_at"], since)
+        return {
+            "slots": self.slots,
+            "in_use": len(running),
+            "queued": len(waiting),
+            "window_seconds": window,
+            "classes": classes,
+            "tenants": tenants,
+            "preemptions": preemptions["n"],
+            "preempted_seconds": preemptions["seconds"],
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Scheduler of agent calls shared by app, daemon and job workers.")
+    parser.add_argument("--db", default=SCHEDULER_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+    status = commands.add_parser("status", help="queue depth, slots in use and wait times")
+    status.add_argument("--window", type=float, default=300.0, help="seconds of history for wait times")
+    args = parser.parse_args(argv)
+
+    if not args.db:
+        print("Scheduling is disabled (SCHEDULER_DB is empty)", file=sys.stderr)
+        return 1
+    scheduler = Scheduler(args.db, max(LLM_SLOTS, 1))
+    if args.command == "status":
+        print(json.dumps(scheduler.metrics(args.window), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
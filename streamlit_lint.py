@@ -0,0 +1,280 @@
+import ast
+import sys
+from typing import Dict, List, Optional, Set
+
+from project_layout import is_project_bundle, split_project
+from review_loop import SEVERITIES, ReviewIssue
+
+# Calls that open a connection or build a client: create them once per process
+_RESOURCE_CALLS = {
+    "sqlite3.connect", "sqlalchemy.create_engine", "requests.Session", "httpx.Client", "psycopg2.connect",
+    "pymongo.MongoClient", "redis.Redis", "boto3.client", "boto3.resource", "openai.OpenAI", "transformers.pipeline",
+}
+# Calls that load data from disk or the network: cache their results
+_DATA_CALLS = {
+    "open", "json.load", "pickle.load", "joblib.load", "numpy.load", "numpy.loadtxt", "numpy.genfromtxt",
+    "requests.get", "requests.post", "requests.request", "httpx.get", "httpx.post", "urllib.request.urlopen",
+}
+_DATA_PREFIXES = ("pandas.read_", "polars.read_")
+_CACHE_DECORATORS = {"streamlit.cache_resource", "streamlit.cache_data", "streamlit.cache",
+                     "streamlit.experimental_memo", "streamlit.experimental_singleton"}
+_CALLBACK_KEYWORDS = {"on_click", "on_change", "on_submit"}
+_MUTATORS = {"append", "extend", "insert", "update", "add", "pop", "remove", "clear", "setdefault", "discard",
+             "popitem"}
+# Loops over at least this many items are worth caching rather than repeating on every rerun
+_LARGE_RANGE = 10_000
+
+FIX_INSTRUCTIONS = """
+            A Streamlit script reruns from top to bottom on every widget interaction, so:
+            - build objects and connections once in a function decorated with @st.cache_resource
+            - load data in a function decorated with @st.cache_data
+            - keep values that must survive a rerun in st.session_state, initialised with `if key not in st.session_state`
+            - never assign attributes of widgets; read their return value and pass value=/key= instead
+            - update output through a placeholder (e.g. placeholder = st.empty(); placeholder.write(...))
+            """
+
+
+def _app_classes(app_code: str) -> Set[str]:
+    """Classes the application code defines (in every file of a bundle)."""
+    files = split_project(app_code) if is_project_bundle(app_code) else {"": app_code}
+    classes = set()
+    for source in files.values():
+        try:
+            classes |= {node.name for node in ast.parse(source).body if isinstance(node, ast.ClassDef)}
+        except SyntaxError:
+            continue
+    return classes
+
+
+def _is_main_guard(node: ast.If) -> bool:
+    return "__name__" in ast.unparse(node.test)
+
+
+class _Linter:
+    """Walks a Streamlit script, tracking whether code runs on every rerun."""
+
+    def __init__(self, tree: ast.Module, app_classes: Set[str]):
+        self.tree = tree
+        self.app_classes = set(app_classes)
+        self.issues: List[ReviewIssue] = []
+        self.imports: Dict[str, str] = {}
+        self.widgets: Set[str] = set()
+        self.module_state: Dict[str, int] = {}
+        self.reported_state: Set[str] = set()
+        self.callbacks: Set[str] = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    # `import a.b` binds `a`; `import a.b as c` binds `c` to `a.b`
+                    bound = alias.asname or alias.name.split(".")[0]
+                    self.imports[bound] = alias.name if alias.asname else bound
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                for alias in node.names:
+                    self.imports[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+                    if node.module.split(".")[0] in ("main", "app") or node.level:
+                        if alias.name[:1].isupper():
+                            self.app_classes.add(alias.name)
+            elif isinstance(node, ast.keyword) and node.arg in _CALLBACK_KEYWORDS and isinstance(node.value, ast.Name):
+                self.callbacks.add(node.value.id)
+            elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Call) and self._is_streamlit(node.value):
+                for target in node.targets:
+                    names = target.elts if isinstance(target, (ast.Tuple, ast.List)) else [target]
+                    self.widgets |= {name.id for name in names if isinstance(name, ast.Name)}
+        for node in tree.body:
+            if isinstance(node, (ast.Assign, ast.AnnAssign)) and self._is_state_value(node.value):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        self.module_state.setdefault(target.id, node.lineno)
+
+    def _qualified(self, node: ast.AST) -> str:
+        """Dotted name of an expression with import aliases resolved, e.g. pd.read_csv -> pandas.read_csv."""
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return ""
+        parts.append(self.imports.get(node.id, node.id))
+        return ".".join(reversed(parts))
+
+    def _is_streamlit(self, call: ast.Call) -> bool:
+        name = self._qualified(call.func)
+        return name.startswith("streamlit.") and not name.startswith(("streamlit.session_state", "streamlit.cache"))
+
+    def _is_session_state(self, node: ast.AST) -> bool:
+        if isinstance(node, ast.Subscript):
+            node = node.value
+        elif isinstance(node, ast.Attribute):
+            node = node.value
+        return self._qualified(node) == "streamlit.session_state"
+
+    def _is_state_value(self, node: Optional[ast.AST]) -> bool:
+        if isinstance(node, (ast.List, ast.Dict, ast.Set)):
+            return True
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return True
+        return isinstance(node, ast.Call) and self._qualified(node.func) in ("list", "dict", "set")
+
+    def _report(self, severity: str, node: ast.AST, function: Optional[str], description: str):
+        location = f"line {node.lineno}" + (f" (in {function})" if function else "")
+        self.issues.append(ReviewIssue(severity=severity, description=description, location=location))
+
+    def lint(self) -> List[ReviewIssue]:
+        self._block(self.tree.body, cached=False, conditional=False, function=None)
+        return sorted(self.issues, key=lambda issue: (SEVERITIES.index(issue.severity),
+                                                      int(issue.location.split()[1])))
+
+    def _block(self, body: List[ast.stmt], cached: bool, conditional: bool, function: Optional[str]):
+        for node in body:
+            self._statement(node, cached, conditional, function)
+
+    def _statement(self, node: ast.stmt, cached: bool, conditional: bool, function: Optional[str]):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            is_cached = any(self._qualified(decorator.func if isinstance(decorator, ast.Call) else decorator)
+                            in _CACHE_DECORATORS for decorator in node.decorator_list)
+            self._block(node.body, cached or is_cached, conditional or node.name in self.callbacks, node.name)
+            return
+        if isinstance(node, ast.ClassDef):
+            return
+        if isinstance(node, ast.Global):
+            for name in node.names:
+                self._module_state(name, node, function)
+            return
+        if isinstance(node, ast.If):
+            self._expressions(node.test, cached, conditional, function)
+            nested = conditional or not _is_main_guard(node)
+            self._block(node.body, cached, nested, function)
+            self._block(node.orelse, cached, nested, function)
+            return
+        if isinstance(node, (ast.For, ast.AsyncFor)):
+            self._loop(node, node.iter, cached, conditional, function)
+            self._expressions(node.iter, cached, conditional, function)
+            self._block(node.body, cached, conditional, function)
+            self._block(node.orelse, cached, conditional, function)
+            return
+        if isinstance(node, ast.While):
+            if not cached and isinstance(node.test, ast.Constant) and node.test.value is True:
+                self._report("major", node, function, "`while True` never lets the script finish, so the app "
+                                                       "cannot rerun or respond to input")
+            self._expressions(node.test, cached, conditional, function)
+            self._block(node.body, cached, conditional, function)
+            return
+        if isinstance(node, (ast.With, ast.AsyncWith)):
+            for item in node.items:
+                self._expressions(item.context_expr, cached, conditional, function)
+            self._block(node.body, cached, conditional, function)
+            return
+        if isinstance(node, ast.Try):
+            self._block(node.body, cached, conditional, function)
+            for handler in node.handlers:
+                self._block(handler.body, cached, True, function)
+            self._block(node.orelse, cached, conditional, function)
+            self._block(node.finalbody, cached, conditional, function)
+            return
+        if isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
+            self._assignment(node, cached, conditional, function)
+        self._expressions(node, cached, conditional, function)
+
+    def _assignment(self, node: ast.stmt, cached: bool, conditional: bool, function: Optional[str]):
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        for target in targets:
+            if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) \
+                    and target.value.id in self.widgets:
+                self._report("major", node, function,
+                             f"assigning `{ast.unparse(target)}` does not update a Streamlit element; pass the value "
+                             f"when creating the widget (value=/key= and st.session_state) or write to a placeholder")
+            elif self._is_session_state(target) and not (conditional or cached) and node.value is not None \
+                    and isinstance(node, ast.Assign) and not any(
+                        self._is_session_state(child) for child in ast.walk(node.value)):
+                self._report("major", node, function,
+                             f"`{ast.unparse(target)}` is reset on every rerun; initialise it only "
+                             f"`if ... not in st.session_state`")
+            elif (function is not None or conditional) and isinstance(target, (ast.Name, ast.Subscript)):
+                name = target.id if isinstance(target, ast.Name) else getattr(target.value, "id", None)
+                if name in self.module_state and (isinstance(node, ast.AugAssign) or isinstance(target, ast.Subscript)):
+                    self._module_state(name, node, function)
+
+    def _module_state(self, name: str, node: ast.AST, function: Optional[str]):
+        if name in self.reported_state:
+            return
+        self.reported_state.add(name)
+        self._report("major", node, function,
+                     f"`{name}` is module-level state, which is re-initialised on every rerun; keep it in "
+                     f"st.session_state")
+
+    def _loop(self, node: ast.AST, iterable: ast.AST, cached: bool, conditional: bool, function: Optional[str]):
+        if cached or conditional or not isinstance(iterable, ast.Call) or self._qualified(iterable.func) != "range":
+            return
+        bound = iterable.args[1] if len(iterable.args) > 1 else iterable.args[0] if iterable.args else None
+        if isinstance(bound, ast.Constant) and isinstance(bound.value, int) and bound.value >= _LARGE_RANGE:
+            self._report("minor", node, function,
+                         f"a {bound.value:,}-step loop is recomputed on every rerun; move it into a function "
+                         f"decorated with @st.cache_data")
+
+    def _expressions(self, root: ast.AST, cached: bool, conditional: bool, function: Optional[str]):
+        stored = set()
+        if isinstance(root, ast.Assign) and any(self._is_session_state(target) for target in root.targets):
+            # Kept for the session, so built once per session rather than per rerun
+            stored.add(root.value)
+        for node in ast.walk(root):
+            if isinstance(node, ast.comprehension):
+                self._loop(node.iter, node.iter, cached, conditional, function)
+            if not isinstance(node, ast.Call) or node in stored:
+                continue
+            name = self._qualified(node.func)
+            short = name.rsplit(".", 1)[-1]
+            if isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name) \
+                    and node.func.value.id in self.module_state and node.func.attr in _MUTATORS \
+                    and (function is not None or conditional):
+                self._module_state(node.func.value.id, node, function)
+            if cached:
+                continue
+            if name == "time.sleep":
+                self._report("major", node, function, "`time.sleep` blocks the script, so the app stops responding "
+                                                      "until it returns")
+            elif conditional:
+                # Under a button, other branch or callback: runs on that event, not on every rerun
+                continue
+            elif name in _RESOURCE_CALLS or (short in self.app_classes and not name.startswith("streamlit.")):
+                self._report("major", node, function,
+                             f"`{short}(...)` is rebuilt on every rerun; create it in a function decorated with "
+                             f"@st.cache_resource, or once per session in st.session_state")
+            elif name in _DATA_CALLS or name.startswith(_DATA_PREFIXES):
+                self._report("major", node, function,
+                             f"`{name}(...)` runs on every rerun; load it in a function decorated with @st.cache_data")
+
+
+def lint_streamlit(ui_code: str, app_code: str = "") -> List[ReviewIssue]:
+    """Streamlit performance anti-patterns in a generated app, most severe first.
+
+    A Streamlit script reruns top to bottom on every interaction, so this
+    flags uncached resources (including the application's own classes) and
+    data loading, module-level state, widget attribute assignment, session
+    state reset on every rerun, blocking calls and large per-rerun loops.
+    """
+    try:
+        tree = ast.parse(ui_code)
+    except SyntaxError as e:
+        return [ReviewIssue(severity="critical", location=f"line {e.lineno or 0}", description=f"does not parse: {e.msg}")]
+    return _Linter(tree, _app_classes(app_code)).lint()
+
+
+def format_findings(issues: List[ReviewIssue]) -> str:
+    """Findings as feedback lines for the UI agent."""
+    return "\n".join(f"- [{issue.severity}] {issue.location}: {issue.description}" for issue in issues)
+
+
+if __name__ == "__main__":
+    # python streamlit_lint.py output/code/app.py [output/code/main.py]
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python streamlit_lint.py APP_PY [APPLICATION_PY]")
+    with open(sys.argv[1]) as f:
+        ui_code = f.read()
+    app_code = ""
+    if len(sys.argv) == 3:
+        with open(sys.argv[2]) as f:
+            app_code = f.read()
+    findings = lint_streamlit(ui_code, app_code)
+    print(format_findings(findings) or "No findings")
+    sys.exit(1 if any(issue.blocking for issue in findings) else 0)
@@ -0,0 +1,206 @@
+import ast
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from project_layout import is_project_bundle, split_project, with_package_inits
+from tracing import span, wrap
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MEMORY_MB = 512
+OUTPUT_TAIL = 2000
+
+# Runs first inside the sandboxed interpreter: apply resource limits
+_LIMITS = """
+import sys
+try:
+    import resource
+    memory = int(sys.argv[1]) * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    cpu = int(float(sys.argv[2])) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+except (ImportError, ValueError, OSError):
+    pass
+"""
+
+_PYTEST = """
+import pytest
+sys.exit(pytest.main(sys.argv[3:]))
+"""
+
+_IMPORT = """
+import importlib
+for module in sys.argv[3:]:
+    importlib.import_module(module)
+"""
+
+
+def collect_test_ids(tests: str, filename: str = "test_main.py") -> List[str]:
+    """Pytest node ids of the test functions and Test* class methods in a test module."""
+    try:
+        tree = ast.parse(tests)
+    except SyntaxError:
+        return []
+    ids = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            ids.append(f"{filename}::{node.name}")
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            ids.extend(f"{filename}::{node.name}::{item.name}" for item in node.body
+                       if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name.startswith("test"))
+    return ids
+
+
+def code_modules(code: str) -> List[str]:
+    """Importable module names of the code (a single main module, or every module of a project)."""
+    if not is_project_bundle(code):
+        return ["main"]
+    modules = []
+    for path in split_project(code):
+        if path.endswith(".py"):
+            module = path[:-3].replace("/", ".")
+            modules.append(module[:-len(".__init__")] if module.endswith(".__init__") else module)
+    return modules
+
+
+def prepare_workspace(code: str, tests: str, filename: str = "test_main.py") -> str:
+    """Write the code and tests (or another module using the code) into a fresh temporary directory."""
+    workspace = tempfile.mkdtemp(prefix="agent_tests_")
+    files = with_package_inits(split_project(code)) if is_project_bundle(code) else {"main.py": code}
+    files[filename] = tests
+    for path, source in files.items():
+        target = os.path.join(workspace, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w") as f:
+            f.write(source)
+    return workspace
+
+
+def _sandbox_env(workspace: str) -> Dict[str, str]:
+    """Minimal environment: no API keys or other secrets leak into generated code."""
+    env = {key: os.environ[key] for key in ("PATH", "LANG", "LC_ALL", "SYSTEMROOT") if key in os.environ}
+    env.update({
+        "HOME": workspace,
+        "PYTHONPATH": workspace,
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "PYTHONHASHSEED": "0",
+    })
+    return env
+
+
+def run_sandboxed(workspace: str, script: str, args: List[str], timeout: float = DEFAULT_TIMEOUT,
+                  memory_mb: int = DEFAULT_MEMORY_MB) -> Dict:
+    """Run a Python script in an isolated, resource-limited subprocess of the workspace.
+
+    The script sees its own arguments from sys.argv[3:]. Returns the return
+    code (None on timeout), duration and full stdout/stderr.
+    """
+    command = [sys.executable, "-c", _LIMITS + script, str(memory_mb), str(timeout), *args]
+    start = time.monotonic()
+    try:
+        completed = subprocess.run(command, cwd=workspace, env=_sandbox_env(workspace), capture_output=True,
+                                   text=True, timeout=timeout, stdin=subprocess.DEVNULL)
+    except subprocess.TimeoutExpired as e:
+        output = (e.stdout or "") if isinstance(e.stdout, str) else (e.stdout or b"").decode(errors="replace")
+        return {"returncode": None, "duration": time.monotonic() - start, "stdout": output, "stderr": ""}
+    return {"returncode": completed.returncode, "duration": time.monotonic() - start,
+            "stdout": completed.stdout, "stderr": completed.stderr}
+
+
+def run_pytest(workspace: str, args: List[str], timeout: float = DEFAULT_TIMEOUT,
+               memory_mb: int = DEFAULT_MEMORY_MB) -> Dict:
+    """Run pytest in an isolated subprocess of the workspace."""
+    completed = run_sandboxed(workspace, _PYTEST, ["-q", "-p", "no:cacheprovider", "--no-header", *args],
+                              timeout, memory_mb)
+    if completed["returncode"] is None:
+        outcome = "timeout"
+    else:
+        outcome = {0: "passed", 1: "failed", 5: "not collected"}.get(completed["returncode"], "error")
+    return {
+        "outcome": outcome,
+        "returncode": completed["returncode"],
+        "duration": completed["duration"],
+        "output": (completed["stdout"] + completed["stderr"])[-OUTPUT_TAIL:],
+    }
+
+
+def _run_one(workspace: str, test_id: str, timeout: float, memory_mb: int) -> Dict:
+    with span(test_id, cat="test"):
+        return dict(run_pytest(workspace, [test_id], timeout, memory_mb), test=test_id)
+
+
+def _collection_source(workspace: str, code: str, timeout: float, memory_mb: int) -> str:
+    """Whether a collection error comes from the code (it does not import on its own) or the tests."""
+    completed = run_sandboxed(workspace, _IMPORT, code_modules(code), timeout, memory_mb)
+    return "tests" if completed["returncode"] == 0 else "code"
+
+
+def run_tests(code: str, tests: str, workers: Optional[int] = None, timeout: float = DEFAULT_TIMEOUT,
+              memory_mb: int = DEFAULT_MEMORY_MB) -> Dict:
+    """Run each generated test in its own sandboxed subprocess across a worker pool.
+
+    Returns a summary with per-test results. A module that cannot be imported
+    (collection error) is reported once instead of failing every test, with
+    its source: "code" if the code itself fails to import, else "tests".
+    """
+    filename = "test_main.py"
+    workspace = prepare_workspace(code, tests, filename)
+    try:
+        collection = run_pytest(workspace, ["--collect-only", filename], timeout=timeout, memory_mb=memory_mb)
+        test_ids = collect_test_ids(tests, filename)
+        if collection["outcome"] not in ("passed", "not collected") or not test_ids:
+            source = _collection_source(workspace, code, timeout, memory_mb) if test_ids else "tests"
+            results = [dict(collection, test=filename, outcome="error" if test_ids else collection["outcome"],
+                            source=source)]
+        else:
+            workers = workers or min(len(test_ids), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(wrap(lambda test_id: _run_one(workspace, test_id, timeout, memory_mb)),
+                                            test_ids))
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result["outcome"]] = counts.get(result["outcome"], 0) + 1
+    return {
+        "total": len(results),
+        "counts": counts,
+        "passed": bool(results) and all(result["outcome"] == "passed" for result in results),
+        "duration": sum(result["duration"] for result in results),
+        "results": results,
+    }
+
+
+def collection_error(summary: Dict) -> Optional[Dict]:
+    """The result reporting that the test module could not be collected, if any."""
+    return next((result for result in summary["results"] if "source" in result), None)
+
+
+def format_failures(summary: Dict, limit: int = 10) -> str:
+    """Describe failing tests as concrete feedback for the coding agent.
+
+    Test modules that could not be collected are only reported when the code
+    itself fails to import; otherwise the tests, not the code, need fixing.
+    """
+    error = collection_error(summary)
+    if error is not None:
+        if error["source"] != "code":
+            return ""
+        return (f"The code could not be imported by the tests:\n```\n{error['output'].strip()[-800:]}\n```"
+                "\nFix the code so it imports cleanly.")
+    failures = [result for result in summary["results"] if result["outcome"] != "passed"]
+    if not failures:
+        return ""
+    lines = [f"{len(failures)} of {summary['total']} generated tests did not pass when executed:"]
+    for result in failures[:limit]:
+        lines.append(f"\n### {result['test']} ({result['outcome']})\n```\n{result['output'].strip()[-800:]}\n```")
+    if len(failures) > limit:
+        lines.append(f"\n... and {len(failures) - limit} more")
+    lines.append("\nFix the code so these tests pass. If a test contradicts the requirements, keep the code correct.")
+    return "\n".join(lines)
@@ -0,0 +1,29 @@
+import glob
+import os
+
+from artifact_store import ArtifactStore
+
+
+def test_saving_same_content_twice_leaves_no_temp_files(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    store.put("run-1", "code/app.py", "print('hi')\n")
+    store.flush()
+    store.put("run-1", "code/app.py", "print('hi')\n")
+    store.flush()
+
+    path = os.path.join(store.run_dir("run-1"), "files", "code", "app.py")
+    with open(path) as f:
+        assert f.read() == "print('hi')\n"
+    assert glob.glob(os.path.join(str(tmp_path), "**", "*.tmp"), recursive=True) == []
+
+
+def test_changed_content_replaces_the_run_file(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    store.put("run-1", "code/app.py", "v1\n")
+    store.flush()
+    store.put("run-1", "code/app.py", "v2\n")
+    store.flush()
+
+    with open(os.path.join(store.run_dir("run-1"), "files", "code", "app.py")) as f:
+        assert f.read() == "v2\n"
+    assert glob.glob(os.path.join(str(tmp_path), "**", "*.tmp"), recursive=True) == []
@@ -0,0 +1,37 @@
+import conversation_memory
+
+
+class FakeAgent:
+    def __init__(self):
+        self.chat_messages = {}
+
+    def clear_history(self, partner):
+        self.chat_messages.pop(partner, None)
+
+
+def _chat(sender, agent, text):
+    for owner, partner in ((sender, agent), (agent, sender)):
+        owner.chat_messages.setdefault(partner, []).extend(
+            [{"role": "user", "content": text}, {"role": "assistant", "content": "ok"}])
+
+
+def test_default_policy_sends_no_history():
+    memory = conversation_memory.ConversationMemory()
+    sender, agent = FakeAgent(), FakeAgent()
+    _chat(sender, agent, "write the code " * 50)
+    memory.after_call(sender, agent)
+
+    assert memory.policy == "clear"
+    assert memory.history_tokens(sender, agent) == 0
+    assert sender.chat_messages == {} and agent.chat_messages == {}
+
+
+def test_stage_policy_keeps_history_until_the_next_stage():
+    memory = conversation_memory.ConversationMemory(policy="stage")
+    sender, agent = FakeAgent(), FakeAgent()
+    _chat(sender, agent, "write the code " * 50)
+    memory.after_call(sender, agent)
+
+    assert memory.history_tokens(sender, agent) > 0
+    memory.on_span("begin", "run_code_review", "stage", {})
+    assert memory.history_tokens(sender, agent) == 0
@@ -0,0 +1,46 @@
+import incremental
+
+TESTS = '''import pytest
+from main import Calculator, parse
+
+
+@pytest.fixture
+def calc():
+    return Calculator()
+
+
+@pytest.fixture
+def loaded(calc):
+    calc.store(1)
+    return calc
+
+
+def test_add(calc):
+    assert calc.add(1, 2) == 3
+
+
+def test_recall(loaded):
+    assert loaded.recall() == 1
+
+
+def test_parse():
+    assert parse("1") == 1
+
+
+@pytest.mark.usefixtures("calc")
+class TestWithFixture:
+    def test_marked(self):
+        assert True
+'''
+
+
+def test_tests_using_a_name_through_fixtures_are_touched():
+    assert incremental.tests_touching(TESTS, {"Calculator"}) == [
+        "test_main.py::test_add",
+        "test_main.py::test_recall",
+        "test_main.py::TestWithFixture::test_marked",
+    ]
+
+
+def test_tests_using_a_name_directly_are_touched():
+    assert incremental.tests_touching(TESTS, {"parse"}) == ["test_main.py::test_parse"]
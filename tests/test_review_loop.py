@@ -0,0 +1,22 @@
+from review_loop import ReviewIssue, ReviewVerdict, merge_verdicts, parse_review_verdict
+
+
+def test_unstructured_revision_request_fails_merge_with_only_minor_issues():
+    unstructured = parse_review_verdict("The error handling is wrong.\nVerdict: NEEDS REVISION")
+    structured = ReviewVerdict(verdict="PASS", issues=[ReviewIssue("minor", "Name is unclear", "parse")])
+
+    merged = merge_verdicts([unstructured, structured])
+
+    assert not merged.passed
+    assert merged.verdict == "NEEDS_REVISION"
+    assert merged.to_dict()["passed"] is False
+
+
+def test_merge_passes_when_no_chunk_blocks():
+    first = ReviewVerdict(verdict="PASS")
+    second = ReviewVerdict(verdict="NEEDS_REVISION", issues=[ReviewIssue("info", "Consider a docstring")])
+
+    merged = merge_verdicts([first, second])
+
+    assert merged.passed
+    assert merged.verdict == "PASS"
@@ -0,0 +1,33 @@
+import streamlit_lint
+
+APP = '''class Calculator:
+    pass
+'''
+
+
+def _lint(ui_code):
+    return [issue.description for issue in streamlit_lint.lint_streamlit(ui_code, APP)]
+
+
+def test_construction_under_a_button_is_not_a_rerun_cost():
+    ui_code = '''import sqlite3
+import streamlit as st
+from main import Calculator
+
+if st.button("Run"):
+    calculator = Calculator()
+    conn = sqlite3.connect("app.db")
+    st.write(calculator)
+'''
+    assert _lint(ui_code) == []
+
+
+def test_construction_on_every_rerun_is_reported():
+    ui_code = '''import streamlit as st
+from main import Calculator
+
+calculator = Calculator()
+st.write(calculator)
+'''
+    issues = _lint(ui_code)
+    assert len(issues) == 1 and "`Calculator(...)` is rebuilt on every rerun" in issues[0]
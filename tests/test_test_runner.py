@@ -0,0 +1,30 @@
+import test_runner
+
+CODE = '''def add(a, b):
+    return a + b
+'''
+
+
+def test_tests_importing_a_missing_name_are_not_sent_to_the_coder():
+    tests = "from main import add, subtract\n\n\ndef test_add():\n    assert add(1, 2) == 3\n"
+    summary = test_runner.run_tests(CODE, tests)
+
+    error = test_runner.collection_error(summary)
+    assert error is not None and error["source"] == "tests"
+    assert test_runner.format_failures(summary) == ""
+
+
+def test_code_that_does_not_import_is_sent_to_the_coder():
+    tests = "from main import add\n\n\ndef test_add():\n    assert add(1, 2) == 3\n"
+    summary = test_runner.run_tests("def add(a, b)\n    return a + b\n", tests)
+
+    assert test_runner.collection_error(summary)["source"] == "code"
+    assert "could not be imported" in test_runner.format_failures(summary)
+
+
+def test_failing_tests_are_reported_without_a_collection_error():
+    tests = "from main import add\n\n\ndef test_add():\n    assert add(1, 2) == 4\n"
+    summary = test_runner.run_tests(CODE, tests)
+
+    assert test_runner.collection_error(summary) is None
+    assert "test_main.py::test_add (failed)" in test_runner.format_failures(summary)
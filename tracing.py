@@ -0,0 +1,157 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# Directory for per-run trace files; empty disables export
+TRACE_DIR = os.getenv("TRACE_DIR", "output/traces")
+
+# The tracer of the run executing in this context, and the innermost open span
+_current_tracer: contextvars.ContextVar = contextvars.ContextVar("tracer", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+
+
+class Tracer:
+    """Collects spans of one run as Chrome trace events (viewable in Perfetto or chrome://tracing)."""
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+        self.events: List[Dict] = []
+        # Wall-clock time of ts=0, to place spans in time outside the trace
+        self.started_at = time.time()
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._threads: Dict[int, int] = {}
+        # Called as listener(phase, name, cat, args) when a span begins or ends, e.g. for progress reporting
+        self.listeners: List[Callable] = []
+
+    def _now_us(self) -> float:
+        return (time.perf_counter_ns() - self._origin) / 1000
+
+    def _tid(self) -> int:
+        ident = threading.get_ident()
+        if ident not in self._threads:
+            self._threads[ident] = len(self._threads) + 1
+            self.events.append({"ph": "M", "name": "thread_name", "pid": 1, "tid": self._threads[ident],
+                                "args": {"name": threading.current_thread().name}})
+        return self._threads[ident]
+
+    def _new_id(self) -> int:
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def add_span(self, name: str, cat: str, start_us: float, end_us: float, span_id: int,
+                 parent_id: Optional[int], args: Dict):
+        with self._lock:
+            self.events.append({
+                "ph": "X", "name": name, "cat": cat, "pid": 1, "tid": self._tid(),
+                "ts": round(start_us, 3), "dur": round(end_us - start_us, 3),
+                "args": dict(args, span_id=span_id, parent_id=parent_id),
+            })
+
+    def add_instant(self, name: str, cat: str, args: Dict):
+        with self._lock:
+            self.events.append({"ph": "i", "s": "t", "name": name, "cat": cat, "pid": 1, "tid": self._tid(),
+                                "ts": round(self._now_us(), 3), "args": args})
+
+    def notify(self, phase: str, name: str, cat: str, args: Dict):
+        for listener in self.listeners:
+            listener(phase, name, cat, args)
+
+    def spans(self) -> List[Dict]:
+        return [event for event in self.events if event["ph"] == "X"]
+
+    def export(self, path: Optional[str] = None) -> str:
+        """Write the trace as Chrome trace JSON and return its path."""
+        path = path or os.path.join(TRACE_DIR, f"run_{self.run_id}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"run_id": self.run_id}}, f)
+        return path
+
+
+def current_tracer() -> Optional[Tracer]:
+    return _current_tracer.get()
+
+
+@contextmanager
+def activate(tracer: Tracer):
+    """Make tracer the active one for this context (and threads started with wrap)."""
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+@contextmanager
+def span(name: str, cat: str = "pipeline", **args):
+    """Time a block as a span, nested under the enclosing span. No-op without an active tracer."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield
+        return
+    span_id = tracer._new_id()
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start = tracer._now_us()
+    tracer.notify("begin", name, cat, args)
+    try:
+        yield
+    except BaseException as e:
+        args["error"] = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        tracer.add_span(name, cat, start, tracer._now_us(), span_id, parent_id, args)
+        tracer.notify("end", name, cat, args)
+
+
+def instant(name: str, cat: str = "pipeline", **args):
+    """Mark a point in time (e.g. a hedge being fired)."""
+    tracer = _current_tracer.get()
+    if tracer is not None:
+        tracer.add_instant(name, cat, args)
+
+
+def traced(name: Optional[str] = None, cat: str = "stage"):
+    """Decorator wrapping every call of a function in a span."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__name__, cat):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(fn: Callable) -> Callable:
+    """Carry the current tracer and parent span into a worker thread.
+
+    Time between wrapping (submission) and the call starting is recorded as
+    a "queued" span.
+    """
+    context = contextvars.copy_context()
+    tracer = _current_tracer.get()
+    submitted = tracer._now_us() if tracer else 0.0
+
+    def run(*args, **kwargs):
+        if tracer is not None:
+            tracer.add_span("queued", "queue", submitted, tracer._now_us(), tracer._new_id(),
+                            _current_span.get(), {})
+        return fn(*args, **kwargs)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # A Context can only be entered by one thread at a time
+        return context.copy().run(run, *args, **kwargs)
+    return wrapper